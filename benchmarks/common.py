@@ -0,0 +1,49 @@
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+# Helpers shared by the benchmark suites: timing, result entries and the JSON report
+
+
+# Run function repeat times and return the elapsed seconds of each run
+def UAB_bench_time(function, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+# Build a result entry from the run times and the number of operations done by each run
+def UAB_bench_result(name, params, times, operations, unit):
+    median = statistics.median(times)
+    return {"name": name, "params": params, "operations": operations, "unit": unit,
+            "median_seconds": median, "min_seconds": min(times), "max_seconds": max(times),
+            "rate": operations / median if median > 0 else None}
+
+
+# Current git revision, to tell apart the versions being compared
+def UAB_bench_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# Write the report of a suite as JSON to the file output, or to stdout if output is None
+def UAB_bench_write_report(suite, repeat, results, output=None):
+    report = {"suite": suite, "revision": UAB_bench_revision(), "date": datetime.now().isoformat(),
+              "python": platform.python_version(), "platform": platform.platform(), "repeat": repeat,
+              "results": results}
+
+    if output is None:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    else:
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,163 @@
+# Run from the repository root: python -m benchmarks.practica4_bench --output results.json
+
+import argparse
+import hashlib
+import os
+import statistics
+import time
+
+from benchmarks.common import UAB_bench_result, UAB_bench_time, UAB_bench_write_report
+from practicas.practica4 import (MAX_TARGET, UAB_blockchain_mine, UAB_blockchain_mine_parallel, UAB_btc_hash,
+                                 UAB_build_block_template, UAB_compute_merkle_root, UAB_create_tree,
+                                 UAB_header_prefix, UAB_search_nonce, UAB_search_nonce_vectorized,
+                                 UAB_validate_inclusion_batch, UAB_validate_inclusion_simplified, blockchain_struct,
+                                 merkle_tree_struct, transaction_struct)
+
+MINING_TARGETS = [MAX_TARGET, "0" + "F" * 63, "00" + "F" * 62, "000" + "F" * 61]
+PARALLEL_MINING_TARGETS = ["000" + "F" * 61, "0000" + "F" * 60]
+VECTORIZED_BATCH_SIZES = [4096, 16384, 32768, 65536]
+MERKLE_SIZES = [1, 2, 3, 1000, 1024, 1025, 100000, 131072, 1000000]
+PROOF_TREE_SIZES = [1024, 100000]
+
+
+# Deterministic list of n transactions, so every run hashes the same data
+def UAB_bench_transactions(n):
+    return [transaction_struct(UAB_btc_hash(str(i))) for i in range(n)]
+
+
+# Hashes per second of UAB_blockchain_mine, mining blocks_per_run blocks at each target
+def UAB_bench_mining(targets, blocks_per_run, repeat):
+    results = []
+    txs = UAB_bench_transactions(4)
+    for target in targets:
+        times, hashes = [], []
+        for i in range(repeat):
+            blk_chain = blockchain_struct()
+            start = time.perf_counter()
+            for j in range(blocks_per_run):
+                UAB_blockchain_mine(blk_chain, txs, target)
+            times.append(time.perf_counter() - start)
+            hashes.append(sum(block.block_header.nonce + 1 for block in blk_chain.get_blocks()))
+
+        # The nonce search depends on the block time, so rate is hashes over time of the same runs
+        result = UAB_bench_result("UAB_blockchain_mine", {"target": target, "blocks": blocks_per_run}, times,
+                                  statistics.median(hashes), "hashes")
+        result["rate"] = sum(hashes) / sum(times)
+        results.append(result)
+    return results
+
+
+# Hashes per second of UAB_blockchain_mine_parallel, counting the hashes of every batch its workers completed
+def UAB_bench_mining_parallel(targets, blocks_per_run, repeat, num_workers):
+    results = []
+    txs = UAB_bench_transactions(4)
+    for target in targets:
+        times, hashes = [], []
+        for i in range(repeat):
+            blk_chain = blockchain_struct()
+            stats = {}
+            run_hashes = 0
+            start = time.perf_counter()
+            for j in range(blocks_per_run):
+                UAB_blockchain_mine_parallel(blk_chain, txs, target, num_workers, stats)
+                run_hashes += stats["hashes"]
+            times.append(time.perf_counter() - start)
+            hashes.append(run_hashes)
+
+        result = UAB_bench_result("UAB_blockchain_mine_parallel",
+                                  {"target": target, "blocks": blocks_per_run, "workers": num_workers}, times,
+                                  statistics.median(hashes), "hashes")
+        result["rate"] = sum(hashes) / sum(times)
+        results.append(result)
+    return results
+
+
+# Hashes per second of the scalar and vectorized nonce searches over the same nonces of one header, with a target no
+# digest is below so every nonce is tried. The vectorized search is skipped if NumPy is not installed.
+def UAB_bench_nonce_search(nonces, batch_sizes, repeat):
+    header = UAB_build_block_template(blockchain_struct(), UAB_bench_transactions(4), MAX_TARGET).block_header
+    prefix = UAB_header_prefix(header)
+    prefix_hash = hashlib.sha256(prefix.encode('utf-8'))
+    start, stop = 10 ** 6, 10 ** 6 + nonces
+
+    times = UAB_bench_time(lambda: UAB_search_nonce(prefix_hash, bytes(32), start, stop), repeat)
+    results = [UAB_bench_result("UAB_search_nonce", {"nonces": nonces}, times, nonces, "hashes")]
+
+    try:
+        import numpy
+    except ImportError:
+        return results
+    for batch_size in batch_sizes:
+        times = UAB_bench_time(lambda: UAB_search_nonce_vectorized(prefix, bytes(32), start, stop, batch_size),
+                               repeat)
+        results.append(UAB_bench_result("UAB_search_nonce_vectorized", {"nonces": nonces, "batch_size": batch_size},
+                                        times, nonces, "hashes"))
+    return results
+
+
+# Merkle root and tree construction throughput for every size up to max_txs
+def UAB_bench_merkle(sizes, max_txs, max_create_tree, repeat):
+    results = []
+    for n in sizes:
+        if n > max_txs:
+            continue
+        txs = UAB_bench_transactions(n)
+        times = UAB_bench_time(lambda: UAB_compute_merkle_root(txs), repeat)
+        results.append(UAB_bench_result("UAB_compute_merkle_root", {"txs": n}, times, n, "txs"))
+
+        # UAB_create_tree needs at least two leaves and a power of two of them, as UAB_compute_merkle_root used to pad
+        if 2 <= n <= max_create_tree:
+            padded = txs + [txs[-1]] * ((1 << (n - 1).bit_length()) - n)
+            times = UAB_bench_time(lambda: UAB_create_tree(padded), repeat)
+            results.append(UAB_bench_result("UAB_create_tree", {"txs": n, "padded_txs": len(padded)}, times, n,
+                                            "txs"))
+    return results
+
+
+# Proofs per second of UAB_validate_inclusion_simplified and UAB_validate_inclusion_batch, checking one proof per leaf
+def UAB_bench_proofs(sizes, max_txs, repeat):
+    results = []
+    for n in sizes:
+        if n > max_txs:
+            continue
+        txs = UAB_bench_transactions(n)
+        tree = merkle_tree_struct(txs)
+        merkle_root = tree.get_root()
+        proofs = [(tx, tree.get_merkle_path(i)) for i, tx in enumerate(txs)]
+
+        times = UAB_bench_time(lambda: [UAB_validate_inclusion_simplified(tx, merkle_root, merkle_path)
+                                        for tx, merkle_path in proofs], repeat)
+        results.append(UAB_bench_result("UAB_validate_inclusion_simplified", {"txs": n}, times, n, "proofs"))
+
+        times = UAB_bench_time(lambda: UAB_validate_inclusion_batch(merkle_root, proofs), repeat)
+        results.append(UAB_bench_result("UAB_validate_inclusion_batch", {"txs": n}, times, n, "proofs"))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mining and Merkle tree benchmarks for practica4")
+    parser.add_argument("--output", help="JSON file to write the results to (stdout by default)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the median is reported")
+    parser.add_argument("--max-txs", type=int, default=max(MERKLE_SIZES), help="largest transaction count to run")
+    parser.add_argument("--max-create-tree", type=int, default=131072,
+                        help="largest transaction count to run UAB_create_tree with")
+    parser.add_argument("--blocks", type=int, default=20, help="blocks mined per run at each target")
+    parser.add_argument("--parallel-blocks", type=int, default=3,
+                        help="blocks mined per run at each target by UAB_blockchain_mine_parallel")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes used by UAB_blockchain_mine_parallel")
+    parser.add_argument("--nonces", type=int, default=300000, help="nonces tried per run of each nonce search")
+    args = parser.parse_args(argv)
+
+    results = []
+    results += UAB_bench_mining(MINING_TARGETS, args.blocks, args.repeat)
+    results += UAB_bench_mining_parallel(PARALLEL_MINING_TARGETS, args.parallel_blocks, args.repeat, args.workers)
+    results += UAB_bench_nonce_search(args.nonces, VECTORIZED_BATCH_SIZES, args.repeat)
+    results += UAB_bench_merkle(MERKLE_SIZES, args.max_txs, args.max_create_tree, args.repeat)
+    results += UAB_bench_proofs(PROOF_TREE_SIZES, args.max_txs, args.repeat)
+
+    UAB_bench_write_report("practica4", args.repeat, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+# Run from the repository root: python -m benchmarks.practica5_bench --output results.json
+
+import argparse
+import random
+
+from benchmarks.common import UAB_bench_result, UAB_bench_time, UAB_bench_write_report
+from utils.ring_core import UAB_xor, ring_cipher
+
+WIDTHS = [1024, 2048, 4096]
+
+
+# The XOR of the ring primitives before utils.ring_core, kept as the baseline
+def UAB_bench_eval_xor(a, b):
+    return eval("%s^%s" % (a, b))
+
+
+# Deterministic pairs of b-bit values, so every run combines the same data
+def UAB_bench_values(b, n):
+    generator = random.Random(b)
+    return [(generator.getrandbits(b), generator.getrandbits(b)) for i in range(n)]
+
+
+# Calls per second of the eval and native XOR, and of the keyed combining function with its key schedule built once
+def UAB_bench_ring_primitives(widths, calls, repeat):
+    results = []
+    for b in widths:
+        values = UAB_bench_values(b, calls)
+
+        times = UAB_bench_time(lambda: [UAB_bench_eval_xor(x, y) for x, y in values], repeat)
+        results.append(UAB_bench_result("eval_xor", {"bits": b}, times, calls, "calls"))
+
+        times = UAB_bench_time(lambda: [UAB_xor(x, y) for x, y in values], repeat)
+        results.append(UAB_bench_result("UAB_xor", {"bits": b}, times, calls, "calls"))
+
+        times = UAB_bench_time(lambda: [ring_cipher(x, b) for x, y in values], repeat)
+        results.append(UAB_bench_result("ring_cipher key schedule", {"bits": b}, times, calls, "calls"))
+
+        cipher = ring_cipher(values[0][0], b)
+        times = UAB_bench_time(lambda: [cipher.encrypt(x ^ y) for x, y in values], repeat)
+        results.append(UAB_bench_result("ring_cipher.encrypt", {"bits": b}, times, calls, "calls"))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ring signature primitive benchmarks for practica5")
+    parser.add_argument("--output", help="JSON file to write the results to (stdout by default)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement, the median is reported")
+    parser.add_argument("--calls", type=int, default=10000, help="calls of each primitive per run")
+    args = parser.parse_args(argv)
+
+    results = UAB_bench_ring_primitives(WIDTHS, args.calls, args.repeat)
+
+    UAB_bench_write_report("practica5", args.repeat, results, args.output)
+
+
+if __name__ == '__main__':
+    main()
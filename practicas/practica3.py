@@ -1,9 +1,73 @@
-from sage.all import *
+from utils.backend import *
 
-def UAB_generate_ElGamal_keys(nBits):
+from utils.cache import UAB_load_json_cache, UAB_save_json_cache
+
+ELGAMAL_GROUP_CACHE = "elgamal_groups.json"
+
+# Safe primes generated by UAB_generate_safe_prime_group in this process, which UAB_is_safe_prime does not test again
+ELGAMAL_SAFE_PRIMES = set()
+
+
+# Draw a safe prime p = 2q + 1 of nBits bits and a generator alpha of Z_p^*. The only prime factors of p - 1 are 2
+# and q, so alpha is a generator as soon as alpha^2 != 1 and alpha^q != 1, with no factoring needed.
+def UAB_generate_safe_prime_group(nBits):
+    while True:
+        q = random_prime(pow(2, nBits - 1) - 1, False, pow(2, nBits - 2))
+        p = Integer(2 * q + 1)
+        if p.is_prime(proof=False) and q.is_prime():
+            break
+
+    alpha = Integer(randint(2, p - 2))
+    while not UAB_is_safe_prime_generator(p, alpha):
+        alpha = Integer(randint(2, p - 2))
+    ELGAMAL_SAFE_PRIMES.add(int(p))
+    return (p, alpha)
+
+
+# Check that alpha generates Z_p^* for a safe prime p
+def UAB_is_safe_prime_generator(p, alpha):
+    q = (p - 1) // 2
+    return 1 < alpha < p - 1 and power_mod(alpha, 2, p) != 1 and power_mod(alpha, q, p) != 1
+
+
+# Add count new safe prime groups of nBits bits to the persistent group cache and return the groups of that size
+def UAB_fill_ElGamal_group_cache(nBits, count=1):
+    new_groups = [UAB_generate_safe_prime_group(nBits) for i in range(count)]
+
+    # Re-read the cache just before saving, in case another process added groups in the meantime
+    cache = UAB_load_json_cache(ELGAMAL_GROUP_CACHE, {})
+    groups = cache.setdefault(str(nBits), [])
+    groups.extend([int(p), int(alpha)] for (p, alpha) in new_groups)
+    UAB_save_json_cache(ELGAMAL_GROUP_CACHE, cache)
+    return [(Integer(p), Integer(alpha)) for (p, alpha) in groups]
+
+
+# Get a random vetted (p, alpha) group of nBits bits from the persistent cache, generating one if there is none of
+# that size yet. Groups whose p is not a safe prime or whose alpha fails the generator check are ignored. The
+# primality tests are cached by UAB_is_safe_prime, so each entry is only tested once per process.
+def UAB_get_ElGamal_group(nBits):
+    groups = UAB_load_json_cache(ELGAMAL_GROUP_CACHE, {}).get(str(nBits), [])
+    groups = [(Integer(p), Integer(alpha)) for (p, alpha) in groups]
+    groups = [(p, alpha) for (p, alpha) in groups
+              if p.nbits() == nBits and UAB_is_safe_prime(int(p)) and UAB_is_safe_prime_generator(p, alpha)]
+
+    if len(groups) == 0:
+        groups = UAB_fill_ElGamal_group_cache(nBits)[-1:]
+    return groups[randint(0, len(groups) - 1)]
+
+
+# Returns [k_priv, k_pub]. With cached=True the group comes from UAB_get_ElGamal_group, so once the cache is warm a
+# key costs a random d and one modular exponentiation instead of a new prime and a primitive root.
+def UAB_generate_ElGamal_keys(nBits, cached=False):
     if nBits % 64 != 0:
         return None
 
+    if cached:
+        p, alpha = UAB_get_ElGamal_group(nBits)
+        d = Integer(randint(1, p - 2))
+        c = power_mod(alpha, d, p)
+        return [(p, alpha, d), (p, alpha, c)]
+
     p = Integer(0)
 
     while not p.is_prime():
@@ -21,9 +85,110 @@ def UAB_generate_ElGamal_keys(nBits):
     return [k_priv, k_pub]
 
 
-def UAB_ElGamal_sign(k_priv, m, k=None):
-    if len(k_priv) != 3:
-        return None
+import collections
+import functools
+import hashlib
+import itertools
+import multiprocessing
+import os
+import queue
+import secrets
+import threading
+import time
+
+FIXED_BASE_WINDOW = 5
+ELGAMAL_PRECOMPUTATION_CACHE_SIZE = 16
+# Times a key has to be used before its tables are built, so keys used only once never pay for them
+ELGAMAL_PRECOMPUTATION_THRESHOLD = 2
+
+
+# Table to raise a fixed base to any exponent modulo a prime p. Row i holds base^(j * 2^(window * i)) for every
+# window value j, so base^e is the product of one entry per window of e, without any squaring.
+class fixed_base_table():
+
+    # Initialize
+    def __init__(self, base, p, window=FIXED_BASE_WINDOW):
+        self.p = int(p)
+        self.window = window
+        self.rows = []
+
+        row_base = int(base) % self.p
+        for i in range((self.p.bit_length() + window - 1) // window):
+            row = [1]
+            for j in range(1, 1 << window):
+                row.append(row[-1] * row_base % self.p)
+            self.rows.append(row)
+            row_base = row[-1] * row_base % self.p
+
+    # Get base^exponent mod p. Exponents outside the table are reduced mod p - 1 (Fermat), negative ones included
+    def power(self, exponent):
+        exponent = int(exponent)
+        if exponent < 0 or exponent.bit_length() > len(self.rows) * self.window:
+            exponent %= self.p - 1
+
+        mask = (1 << self.window) - 1
+        result = 1
+        for row in self.rows:
+            if exponent == 0:
+                break
+            if exponent & mask:
+                result = result * row[exponent & mask] % self.p
+            exponent >>= self.window
+        return Integer(result)
+
+
+# Fixed-base tables of an ElGamal key: one for alpha and, for a public key (p, alpha, c), one for c
+class elgamal_precomputation():
+
+    # Initialize
+    def __init__(self, key, public=False):
+        p, alpha = key[0], key[1]
+        self.alpha_table = fixed_base_table(alpha, p)
+        self.c_table = fixed_base_table(key[2], p) if public else None
+
+    # Get alpha^exponent mod p
+    def power_alpha(self, exponent):
+        return self.alpha_table.power(exponent)
+
+    # Get c^exponent mod p
+    def power_c(self, exponent):
+        return self.c_table.power(exponent)
+
+
+ELGAMAL_PRECOMPUTATIONS = collections.OrderedDict()
+ELGAMAL_KEY_USES = collections.OrderedDict()
+ELGAMAL_PRECOMPUTATION_LOCK = threading.Lock()
+
+
+# Get the elgamal_precomputation of a key once it has been used ELGAMAL_PRECOMPUTATION_THRESHOLD times, or None
+# before that. The ELGAMAL_PRECOMPUTATION_CACHE_SIZE most recently used keys keep their tables.
+def UAB_get_ElGamal_precomputation(key, public=False):
+    cache_key = (tuple(int(x) for x in key), public)
+    with ELGAMAL_PRECOMPUTATION_LOCK:
+        precomputation = ELGAMAL_PRECOMPUTATIONS.get(cache_key)
+        if precomputation is not None:
+            ELGAMAL_PRECOMPUTATIONS.move_to_end(cache_key)
+            return precomputation
+
+        uses = ELGAMAL_KEY_USES.pop(cache_key, 0) + 1
+        if uses < ELGAMAL_PRECOMPUTATION_THRESHOLD:
+            ELGAMAL_KEY_USES[cache_key] = uses
+            if len(ELGAMAL_KEY_USES) > 4 * ELGAMAL_PRECOMPUTATION_CACHE_SIZE:
+                ELGAMAL_KEY_USES.popitem(last=False)
+            return None
+
+    # Built outside the lock, so a slow build does not block the other keys
+    precomputation = elgamal_precomputation(key, public)
+    with ELGAMAL_PRECOMPUTATION_LOCK:
+        ELGAMAL_PRECOMPUTATIONS[cache_key] = precomputation
+        if len(ELGAMAL_PRECOMPUTATIONS) > ELGAMAL_PRECOMPUTATION_CACHE_SIZE:
+            ELGAMAL_PRECOMPUTATIONS.popitem(last=False)
+    return precomputation
+
+
+# Get a (k, k^-1 mod p - 1, r = alpha^k mod p) signing triple for k_priv, drawing a random k coprime to p - 1 if k
+# is not given
+def UAB_generate_ElGamal_nonce(k_priv, k=None):
     p = k_priv[0]
     k_prime = k  # Just to no make modifications over the input parameters
     if k_prime is None:
@@ -34,13 +199,143 @@ def UAB_ElGamal_sign(k_priv, m, k=None):
             is_invertible = k_prime.gcd(p - 1) == 1
 
     l = inverse_mod(k_prime, p - 1)
-    r = power_mod(k_priv[1], k_prime, p)
+    precomputation = UAB_get_ElGamal_precomputation(k_priv)
+    if precomputation is not None:
+        r = precomputation.power_alpha(k_prime)
+    else:
+        r = power_mod(k_priv[1], k_prime, p)
+
+    return (k_prime, l, r)
+
+
+ELGAMAL_NONCE_POOL_DEPTH = 64
+# Number of recent refills the refill rate is measured over
+ELGAMAL_NONCE_POOL_RATE_WINDOW = 64
+
+
+# Pool of precomputed signing triples (see UAB_generate_ElGamal_nonce) for one private key, kept full by a
+# background thread. Every triple leaves the queue through exactly one get(), so no k is ever used twice.
+class elgamal_nonce_pool():
+
+    # Initialize and start the refill thread
+    def __init__(self, k_priv, depth=ELGAMAL_NONCE_POOL_DEPTH):
+        self.k_priv = k_priv
+        self.triples = queue.Queue(maxsize=depth)
+        self.lock = threading.Lock()
+        self.produced = 0
+        self.consumed = 0
+        self.misses = 0
+        self.refill_times = collections.deque(maxlen=ELGAMAL_NONCE_POOL_RATE_WINDOW)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.refill, daemon=True)
+        self.thread.start()
+
+    # Body of the refill thread
+    def refill(self):
+        while not self.stopped.is_set():
+            triple = UAB_generate_ElGamal_nonce(self.k_priv)
+            while not self.stopped.is_set():
+                try:
+                    self.triples.put(triple, timeout=0.1)
+                except queue.Full:
+                    continue
+
+                with self.lock:
+                    self.produced += 1
+                    self.refill_times.append(time.monotonic())
+                break
+
+    # Take a triple out of the pool, or None if it is empty
+    def get(self):
+        try:
+            triple = self.triples.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with self.lock:
+            self.consumed += 1
+        return triple
+
+    # Stop the refill thread. The triples left in the pool are discarded
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+    # Get the pool depth and counters, and the refill rate (triples per second) over the last refills
+    def get_metrics(self):
+        with self.lock:
+            refill_rate = None
+            if len(self.refill_times) > 1 and self.refill_times[-1] > self.refill_times[0]:
+                refill_rate = (len(self.refill_times) - 1) / (self.refill_times[-1] - self.refill_times[0])
+            return {"depth": self.triples.qsize(), "capacity": self.triples.maxsize, "produced": self.produced,
+                    "consumed": self.consumed, "misses": self.misses, "refill_rate": refill_rate}
+
+
+# Sign m with k_priv. If no k is given and nonce_pool (an elgamal_nonce_pool of k_priv) has a triple ready, signing
+# is just a multiplication and a reduction.
+def UAB_ElGamal_sign(k_priv, m, k=None, nonce_pool=None):
+    if len(k_priv) != 3:
+        return None
+    if nonce_pool is not None and tuple(nonce_pool.k_priv) != tuple(k_priv):
+        return None
+    p = k_priv[0]
+
+    triple = None
+    if k is None and nonce_pool is not None:
+        triple = nonce_pool.get()
+    if triple is None:
+        triple = UAB_generate_ElGamal_nonce(k_priv, k)
+
+    k_prime, l, r = triple
     rd = r * k_priv[2]
     s = Integer(l * (m - rd)).mod(p - 1)
 
     return (r, s)
 
 
+ELGAMAL_BULK_CHUNK_SIZE = 256
+BULK_SIGNING_KEY = None
+
+
+# Initializer of the bulk signing workers. Forked workers inherit the parent's random state, so each one is reseeded
+# from the OS to avoid two workers drawing the same k
+def UAB_init_bulk_signer(k_priv):
+    global BULK_SIGNING_KEY
+    BULK_SIGNING_KEY = k_priv
+    set_random_seed(int.from_bytes(os.urandom(16), byteorder='big'))
+
+
+# Sign a chunk of messages with the key of the bulk signing worker
+def UAB_sign_chunk(messages):
+    return [UAB_ElGamal_sign(BULK_SIGNING_KEY, m) for m in messages]
+
+
+# Sign every message of an iterable with k_priv on a pool of num_workers processes (one per core by default), in
+# chunks of chunk_size messages. Signatures are yielded in input order as soon as their chunk is done. At most
+# 2 * num_workers chunks are in flight, so memory stays flat whatever the size of the input.
+def UAB_ElGamal_sign_bulk(k_priv, messages, num_workers=None, chunk_size=ELGAMAL_BULK_CHUNK_SIZE):
+    if len(k_priv) != 3:
+        return
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    messages = iter(messages)
+    pending = collections.deque()
+    with multiprocessing.Pool(num_workers, initializer=UAB_init_bulk_signer, initargs=(k_priv,)) as pool:
+        while True:
+            chunk = list(itertools.islice(messages, chunk_size))
+            if len(chunk) > 0:
+                pending.append(pool.apply_async(UAB_sign_chunk, (chunk,)))
+
+            if len(pending) > 0 and (len(chunk) == 0 or len(pending) >= 2 * num_workers):
+                for sig in pending.popleft().get():
+                    yield sig
+            elif len(chunk) == 0:
+                break
+
+
 def UAB_ElGamal_verify(sig, k_pub, m):
     r, s = sig[0], sig[1]
     p = k_pub[0]
@@ -48,37 +343,331 @@ def UAB_ElGamal_verify(sig, k_pub, m):
         return False
 
     rs = power_mod(r, s, p)
-    cs = power_mod(k_pub[2], r, p)
+    precomputation = UAB_get_ElGamal_precomputation(k_pub, public=True)
+    if precomputation is not None:
+        cs = precomputation.power_c(r)
+        v2 = precomputation.power_alpha(m)
+    else:
+        cs = power_mod(k_pub[2], r, p)
+        v2 = power_mod(k_pub[1], m, p)
     v1 = Integer(cs * rs).mod(p)
-    v2 = power_mod(k_pub[1], m, p)
     return v1 == v2
 
+MULTI_EXPONENTIATION_WINDOW = 4
+ELGAMAL_BATCH_SECURITY_BITS = 64
+
+
+# Get prod(bases[i]^exponents[i]) mod p for non-negative exponents. All the bases share the same squarings (Straus'
+# interleaving), so each extra base only costs its window table and one product per window of its exponent.
+def UAB_multi_power_mod(bases, exponents, p, window=MULTI_EXPONENTIATION_WINDOW):
+    p = int(p)
+    exponents = [int(e) for e in exponents]
+    mask = (1 << window) - 1
+
+    tables = []
+    for base in bases:
+        row = [1, int(base) % p]
+        for j in range(2, 1 << window):
+            row.append(row[-1] * row[1] % p)
+        tables.append(row)
+
+    max_bits = max([e.bit_length() for e in exponents] + [1])
+    result = 1
+    for shift in range((max_bits - 1) // window * window, -1, -window):
+        if result != 1:
+            for i in range(window):
+                result = result * result % p
+        for row, e in zip(tables, exponents):
+            digit = (e >> shift) & mask
+            if digit:
+                result = result * row[digit] % p
+
+    return Integer(result)
+
+
+# Jacobi symbol (a / n) for an odd n > 0, which is the Legendre symbol when n is prime
+def UAB_jacobi_symbol(a, n):
+    a, n = int(a) % int(n), int(n)
+    result = 1
+    while a != 0:
+        # Strip all the factors of 2 at once, each one flips the sign when n = 3, 5 mod 8
+        twos = (a & -a).bit_length() - 1
+        a >>= twos
+        if twos % 2 == 1 and n % 8 in (3, 5):
+            result = -result
+        a, n = n, a
+        if a % 4 == 3 and n % 4 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+# Check if p = 2q + 1 with q prime. The result is cached, as the batch verifier asks it for every batch of a key, and
+# groups that come from UAB_get_ElGamal_group are vetted there or known from their generation, so their keys never
+# pay for the two primality tests (about 0.3 s at 1024 bits) on the first batch.
+def UAB_is_safe_prime(p):
+    return p in ELGAMAL_SAFE_PRIMES or UAB_test_safe_prime(p)
+
+
+@functools.lru_cache(maxsize=ELGAMAL_PRECOMPUTATION_CACHE_SIZE)
+def UAB_test_safe_prime(p):
+    return p % 2 == 1 and Integer(p).is_prime() and Integer((p - 1) // 2).is_prime()
+
+
+# Check the quadratic character of a signature equation: for a valid one c^r * r^s = alpha^m mod p, so both sides
+# have the same Legendre symbol. Costs no exponentiation, the symbols are +-1. alpha_symbol and c_symbol are the
+# Legendre symbols of alpha and c, which only depend on the key.
+def UAB_ElGamal_symbol_holds(sig, p, alpha_symbol, c_symbol, m):
+    r, s = sig
+    lhs = c_symbol ** (int(r) % 2) * (UAB_jacobi_symbol(r, p) if int(s) % 2 else 1)
+    return lhs == alpha_symbol ** (int(m) % 2)
+
+
+# Check all the (sig, m) pairs at once with the small-exponent test: for random t_i below 2^ELGAMAL_BATCH_SECURITY_BITS,
+# c^(sum t_i r_i) * prod r_i^(t_i s_i) * alpha^(-sum t_i m_i) must be 1 mod p, which takes one multi-exponentiation.
+# This is only sound when every equation error c^r_i * r_i^s_i * alpha^-m_i lies in a subgroup of prime order q
+# >= 2^ELGAMAL_BATCH_SECURITY_BITS: then a forged batch passes with probability about 2^-ELGAMAL_BATCH_SECURITY_BITS.
+# UAB_ElGamal_verify_batch makes sure of it with a safe prime p = 2q + 1 and UAB_ElGamal_symbol_holds on every pair.
+def UAB_ElGamal_batch_holds(pairs, k_pub):
+    p, alpha, c = k_pub
+    order = p - 1
+    c_exponent = alpha_exponent = 0
+    bases, exponents = [], []
+
+    for (sig, m) in pairs:
+        r, s = sig[0], sig[1]
+        t = secrets.randbelow(2 ** ELGAMAL_BATCH_SECURITY_BITS - 1) + 1
+        c_exponent += t * r
+        alpha_exponent += t * m
+        bases.append(r)
+        exponents.append(t * s % order)
+
+    bases += [c, alpha]
+    exponents += [c_exponent % order, -alpha_exponent % order]
+    return UAB_multi_power_mod(bases, exponents, p) == 1
+
+
+# Verify many (sig, m) pairs made with the same k_pub, returning one result per pair, in order, always the same as
+# UAB_ElGamal_verify on each pair. With a safe prime p = 2q + 1, q >= 2^ELGAMAL_BATCH_SECURITY_BITS, the order 2 part of
+# every equation is checked with UAB_ElGamal_symbol_holds and the order q part of all of them at once with
+# UAB_ElGamal_batch_holds; a failing batch is split in halves until the bad signatures are isolated and checked one by
+# one with UAB_ElGamal_verify. Any other p has small subgroups a forgery could hide in, so each pair is checked alone.
+def UAB_ElGamal_verify_batch(pairs, k_pub):
+    pairs = list(pairs)
+    results = [False] * len(pairs)
+    p = k_pub[0]
+
+    # Out of range r values fail on their own and would only make the whole batch fail
+    pending = [i for i, (sig, m) in enumerate(pairs) if len(sig) == 2 and 1 < sig[0] < p - 1]
+    if (p - 1) // 2 < 2 ** ELGAMAL_BATCH_SECURITY_BITS or not UAB_is_safe_prime(int(p)):
+        for i in pending:
+            results[i] = UAB_ElGamal_verify(pairs[i][0], k_pub, pairs[i][1])
+        return results
+
+    alpha_symbol, c_symbol = UAB_jacobi_symbol(k_pub[1], p), UAB_jacobi_symbol(k_pub[2], p)
+    pending = [i for i in pending if UAB_ElGamal_symbol_holds(pairs[i][0], p, alpha_symbol, c_symbol, pairs[i][1])]
+    batches = [pending] if pending else []
+    while batches:
+        batch = batches.pop()
+        if len(batch) == 1:
+            results[batch[0]] = UAB_ElGamal_verify(pairs[batch[0]][0], k_pub, pairs[batch[0]][1])
+        elif UAB_ElGamal_batch_holds([pairs[i] for i in batch], k_pub):
+            for i in batch:
+                results[i] = True
+        else:
+            half = len(batch) // 2
+            batches += [batch[half:], batch[:half]]
+
+    return results
+
+
+# Maximum gcd(s2 - s1, p - 1) and gcd(r, p - 1) UAB_extract_private_key tries, as it tries that many candidates
+ELGAMAL_MAX_KEY_CANDIDATES = 1 << 16
+
+
+# Yield every x in [0, n) with a * x = b (mod n). With g = gcd(a, n) there are none unless g divides b, and otherwise
+# exactly g of them, x0 + j * n / g, where x0 is the solution modulo n / g.
+def UAB_solve_linear_congruence(a, b, n):
+    a, b = Integer(a).mod(n), Integer(b).mod(n)
+    g = a.gcd(n)
+    if b.mod(g) != 0:
+        return
+
+    reduced_n = n // g
+    x0 = Integer(0) if reduced_n == 1 else Integer((b // g) * inverse_mod(a // g, reduced_n)).mod(reduced_n)
+    for j in range(g):
+        yield x0 + j * reduced_n
+
+
+# Recover the private key from two signatures of m1 and m2 made with the same k (same r). Every k solving
+# k * (s2 - s1) = m2 - m1 (mod p - 1) and every d solving r * d = m1 - k * s1 (mod p - 1) are tried, so the cost
+# grows with gcd(s2 - s1, p - 1) and gcd(r, p - 1); pairs where either is above ELGAMAL_MAX_KEY_CANDIDATES are not
+# tried. Only keys with alpha^k = r and alpha^d = c are kept, which can only exist if both signatures are valid, so
+# invalid ones are rejected before solving anything. Returns the key, a list of keys if several are valid, or -1 if
+# there is none.
 def UAB_extract_private_key(k_pub, m1, sig1, m2, sig2):
     if len(sig2) != 2 or len(sig1) != 2 or len(k_pub) != 3 or sig1[0] != sig2[0]:
         return -1
 
-    p = k_pub[0]
+    p, alpha, c = k_pub
+    r = sig1[0]
     m2_minus_m1 = Integer(m2 - m1).mod(p - 1)
-    s2_minus_s1 = Integer(sig2[1] - sig1[1])
-
-    if s2_minus_s1.gcd(p - 1) != 1 or Integer(Integer(sig1[0]).gcd(p - 1) != 1):
-        k = (m2_minus_m1 * s2_minus_s1).mod(p - 1)
-        x = var("x")
-        roots = solve_mod(x*sig1[0] == m1 - k, p - 1)
-        if len(roots) == 0:
-            return - 1
-        return None, None, None
+    s2_minus_s1 = Integer(sig2[1] - sig1[1]).mod(p - 1)
+    if m2_minus_m1 == 0 and s2_minus_s1 == 0:  # The same equation twice, there is nothing to solve
+        return -1
+    if not UAB_ElGamal_verify(sig1, k_pub, m1) or not UAB_ElGamal_verify(sig2, k_pub, m2):
+        return -1
+    if s2_minus_s1.gcd(p - 1) > ELGAMAL_MAX_KEY_CANDIDATES or Integer(r).gcd(p - 1) > ELGAMAL_MAX_KEY_CANDIDATES:
+        return -1
 
-    else:
-        s2_minus_s1 = inverse_mod(s2_minus_s1, p - 1)
+    k_privs = []
+    for k in UAB_solve_linear_congruence(s2_minus_s1, m2_minus_m1, p - 1):
+        if power_mod(alpha, k, p) != r:
+            continue
 
-        k = (m2_minus_m1 * s2_minus_s1).mod(p - 1)
-        inverse_r = inverse_mod(sig1[0], p - 1)
-        d = Integer((m1 - k * sig1[1]) * inverse_r).mod(p - 1)
-        return (k_pub[0], k_pub[1], d)
+        for d in UAB_solve_linear_congruence(r, m1 - k * sig1[1], p - 1):
+            if power_mod(alpha, d, p) == c:
+                k_privs.append((p, alpha, d))
 
+    if len(k_privs) == 0:
+        return -1
+    elif len(k_privs) == 1:
+        return k_privs[0]
+    return k_privs
+
+
+import shutil
+import tempfile
+
+NONCE_SCAN_MEMORY_RECORDS = 1000000
+NONCE_SCAN_PARTITIONS = 64
+
+
+# Read (k_pub, m, sig) records from an iterable of them, or from a text file with one "p alpha c m r s" record per
+# line (blank lines and lines starting with # are skipped)
+def UAB_read_signature_records(source):
+    if not isinstance(source, str):
+        for k_pub, m, sig in source:
+            yield tuple(k_pub), m, tuple(sig)
+        return
+
+    with open(source) as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 0 or fields[0].startswith("#"):
+                continue
+            p, alpha, c, m, r, s = (Integer(field) for field in fields)
+            yield (p, alpha, c), m, (r, s)
+
+
+# Write a record in the format read by UAB_read_signature_records
+def UAB_write_signature_record(f, k_pub, m, sig):
+    f.write("%s %s %s %s %s %s\n" % (k_pub[0], k_pub[1], k_pub[2], m, sig[0], sig[1]))
+
+
+# Look for a previous signature with the same (k_pub, r) as this record in seen, recording it there if there is none,
+# and yield (k_pub, k_priv) for every key UAB_extract_private_key recovers from the pair
+def UAB_check_nonce_reuse(seen, recovered, k_pub, m, sig):
+    previous = seen.setdefault((k_pub, sig[0]), (m, sig))
+    if previous == (m, sig):
+        return
+
+    k_privs = UAB_extract_private_key(k_pub, previous[0], previous[1], m, sig)
+    if not isinstance(k_privs, list):
+        k_privs = [k_privs]
+    for k_priv in k_privs:
+        if isinstance(k_priv, tuple) and len(k_priv) == 3 and None not in k_priv:
+            recovered.add(k_pub)
+            yield k_pub, k_priv
+
+
+# Partition of the records of (k_pub, r) at a depth of the spill. Every depth hashes with SHA-256 under its own
+# prefix, so a partition split again spreads evenly, which the built-in hash of a tuple does not guarantee.
+def UAB_nonce_partition_index(k_pub, r, depth, num_partitions):
+    key = "%d %s %s %s %s" % (depth, k_pub[0], k_pub[1], k_pub[2], r)
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], byteorder='big') % num_partitions
+
+
+# Spill (k_pub, m, sig) records to num_partitions files in partition_dir, partitioned by (k_pub, r) and depth, skipping
+# the keys already recovered. Returns the files (closed) and the number of records written to each.
+def UAB_spill_signature_records(records, recovered, num_partitions, partition_dir, depth):
+    paths = [tempfile.mkstemp(prefix="%d." % depth, suffix=".txt", dir=partition_dir) for i in range(num_partitions)]
+    partitions = [os.fdopen(fd, "w") for (fd, path) in paths]
+    counts = [0] * num_partitions
+    try:
+        for k_pub, m, sig in records:
+            if k_pub not in recovered:
+                i = UAB_nonce_partition_index(k_pub, sig[0], depth, num_partitions)
+                UAB_write_signature_record(partitions[i], k_pub, m, sig)
+                counts[i] += 1
+    finally:
+        for partition in partitions:
+            partition.close()
+    return [path for (fd, path) in paths], counts
+
+
+# Scan a spilled partition of num_records records, split from one of parent_records records. A partition with more
+# than max_records_in_memory records is split again with a different hash, as long as splitting makes it smaller: a
+# partition that did not shrink only holds records of the same (k_pub, r), and the hash index holds one entry for them.
+def UAB_scan_nonce_partition(path, num_records, parent_records, recovered, max_records_in_memory, num_partitions,
+                             depth):
+    if max_records_in_memory < num_records < parent_records:
+        paths, counts = UAB_spill_signature_records(UAB_read_signature_records(path), recovered, num_partitions,
+                                                    os.path.dirname(path), depth)
+        os.remove(path)
+        for sub_path, count in zip(paths, counts):
+            for result in UAB_scan_nonce_partition(sub_path, count, num_records, recovered, max_records_in_memory,
+                                                   num_partitions, depth + 1):
+                yield result
+        return
+
+    seen = {}
+    for k_pub, m, sig in UAB_read_signature_records(path):
+        if k_pub not in recovered:
+            for result in UAB_check_nonce_reuse(seen, recovered, k_pub, m, sig):
+                yield result
+    os.remove(path)
+
+
+# Scan a stream of (k_pub, m, sig) records (see UAB_read_signature_records) for signatures that reuse a nonce, i.e.
+# share (k_pub, r), and yield (k_pub, k_priv) as soon as each private key is recovered. The first signature of every
+# (k_pub, r) is kept in a hash index, so the scan is O(n). Once the index holds max_records_in_memory entries it is
+# spilled, together with the rest of the stream, to num_partitions files partitioned by (k_pub, r), which are then
+# scanned one at a time, splitting again any partition still larger than max_records_in_memory. Keys already
+# recovered are skipped.
+def UAB_scan_nonce_reuse(source, max_records_in_memory=NONCE_SCAN_MEMORY_RECORDS,
+                         num_partitions=NONCE_SCAN_PARTITIONS, tmp_dir=None):
+    seen = {}
+    recovered = set()
+    records = UAB_read_signature_records(source)
+    partition_dir = None
+
+    try:
+        for k_pub, m, sig in records:
+            if k_pub in recovered:
+                continue
+            for result in UAB_check_nonce_reuse(seen, recovered, k_pub, m, sig):
+                yield result
+            if len(seen) >= max_records_in_memory:
+                break
+        else:
+            return
+
+        # The index is full: spill it and the rest of the stream
+        spilled = ((seen_k_pub, seen_m, seen_sig) for (seen_k_pub, r), (seen_m, seen_sig) in seen.items())
+        partition_dir = tempfile.mkdtemp(dir=tmp_dir)
+        paths, counts = UAB_spill_signature_records(itertools.chain(spilled, records), recovered, num_partitions,
+                                                    partition_dir, 0)
+        seen = {}
+        for path, count in zip(paths, counts):
+            for result in UAB_scan_nonce_partition(path, count, sum(counts), recovered, max_records_in_memory,
+                                                   num_partitions, 1):
+                yield result
+
+    finally:
+        if partition_dir is not None:
+            shutil.rmtree(partition_dir, ignore_errors=True)
 
-    return (k_pub[0], k_pub[1], d)
 
 def test_case_1a(name, num_tries, num_bits):
     [k_priv, k_pub] = UAB_generate_ElGamal_keys(num_bits)
@@ -109,6 +698,182 @@ def test_case_2(name, k_pub, m1, sig1, m2, sig2, exp_k_priv):
     extracted_k_priv = UAB_extract_private_key(k_pub, m1, sig1, m2, sig2)
     print("Test", name + ":", exp_k_priv == extracted_k_priv)
 
+def test_case_3(name, num_bits, num_signatures, forge):
+    [k_priv, k_pub] = UAB_generate_ElGamal_keys(num_bits, cached=True)
+    pairs = [(UAB_ElGamal_sign(k_priv, m), m) for m in range(1, num_signatures + 1)]
+    if forge:
+        # Same alpha^m, but with an error of order 2 the small-exponent test alone would miss half the time
+        sig, m = pairs[-1]
+        pairs[-1] = (sig, m + (k_pub[0] - 1) // 2)
+
+    expected = [UAB_ElGamal_verify(sig, k_pub, m) for (sig, m) in pairs]
+    print("Test", name + ":", UAB_ElGamal_verify_batch(pairs, k_pub) == expected)
+
+def test_case_4(name, num_keys, num_signatures, max_records_in_memory, num_partitions):
+    keys = [UAB_generate_ElGamal_keys(64) for i in range(num_keys)]
+    first, middle, last = [], [], []
+    for [k_priv, k_pub] in keys:
+        k = UAB_generate_ElGamal_nonce(k_priv)[0]
+        first.append((k_pub, 1000, UAB_ElGamal_sign(k_priv, 1000, k)))
+        middle += [(k_pub, m, UAB_ElGamal_sign(k_priv, m)) for m in range(num_signatures)]
+        last.append((k_pub, 2000, UAB_ElGamal_sign(k_priv, 2000, k)))
+
+    # The signatures sharing k are at both ends of the stream, so with a small index they meet only after spilling
+    recovered = dict(UAB_scan_nonce_reuse(first + middle + last, max_records_in_memory, num_partitions))
+    expected = {tuple(k_pub): tuple(k_priv) for [k_priv, k_pub] in keys}
+    print("Test", name + ":", recovered == expected)
+
+def test_case_5(name, num_bits):
+    p, alpha = UAB_generate_safe_prime_group(num_bits)
+    t1 = p.nbits() == num_bits and UAB_is_safe_prime(int(p)) and UAB_is_safe_prime_generator(p, alpha)
+
+    # A cache entry that passes the generator check but whose p is not a safe prime must never be handed out
+    cache_dir = os.environ.get("FTI_CACHE_DIR")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["FTI_CACHE_DIR"] = tmp
+        try:
+            bad_p = 2 ** (num_bits - 1) + 1
+            UAB_save_json_cache(ELGAMAL_GROUP_CACHE, {str(num_bits): [[bad_p, 2]]})
+            group = UAB_get_ElGamal_group(num_bits)
+            t2 = group[0] != bad_p and UAB_is_safe_prime(int(group[0]))
+            t3 = [group[0], group[1]] in UAB_load_json_cache(ELGAMAL_GROUP_CACHE, {})[str(num_bits)]
+        finally:
+            if cache_dir is None:
+                del os.environ["FTI_CACHE_DIR"]
+            else:
+                os.environ["FTI_CACHE_DIR"] = cache_dir
+
+    [k_priv, k_pub] = UAB_generate_ElGamal_keys(num_bits, cached=True)
+    t4 = k_pub[2] == power_mod(k_pub[1], k_priv[2], k_pub[0])
+
+    # A generated group is known to be safe without testing it again, and the bad entry is still rejected
+    misses = UAB_test_safe_prime.cache_info().misses
+    t5 = UAB_is_safe_prime(int(p)) and UAB_test_safe_prime.cache_info().misses == misses
+    t5 &= not UAB_is_safe_prime(bad_p)
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5)
+
+def test_case_6(name, num_bits, window):
+    [k_priv, k_pub] = UAB_generate_ElGamal_keys(num_bits, cached=True)
+    p, alpha, c = k_pub
+    table = fixed_base_table(alpha, p, window)
+    exponents = [0, 1, p - 2, p - 1, p, 2 * p + 5, -3] + [randint(0, p - 1) for i in range(20)]
+    t1 = all(table.power(e) == power_mod(alpha, e % (p - 1), p) for e in exponents)
+
+    # Tables are only built once the key has been used ELGAMAL_PRECOMPUTATION_THRESHOLD times
+    uses = [UAB_get_ElGamal_precomputation(k_pub, public=True) for i in range(ELGAMAL_PRECOMPUTATION_THRESHOLD)]
+    t2 = all(uses[i] is None for i in range(ELGAMAL_PRECOMPUTATION_THRESHOLD - 1)) and uses[-1] is not None
+    t3 = UAB_get_ElGamal_precomputation(k_pub, public=True) is uses[-1]
+    t4 = all(uses[-1].power_c(e) == power_mod(c, e % (p - 1), p) for e in exponents)
+
+    # Signatures made and checked with the tables are the ones made without them
+    k, r = 7, power_mod(alpha, 7, p)
+    t5 = True
+    for m in range(2 * ELGAMAL_PRECOMPUTATION_THRESHOLD):
+        sig = UAB_ElGamal_sign(k_priv, m, k)
+        t5 = t5 and sig == (r, inverse_mod(k, p - 1) * (m - r * k_priv[2]) % (p - 1))
+        t5 = t5 and UAB_ElGamal_verify(sig, k_pub, m) and not UAB_ElGamal_verify(sig, k_pub, m + 1)
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5)
+
+def test_case_7(name, num_bits, depth, num_signatures):
+    [k_priv, k_pub] = UAB_generate_ElGamal_keys(num_bits, cached=True)
+    [other_priv, other_pub] = UAB_generate_ElGamal_keys(num_bits, cached=True)
+    nonce_pool = elgamal_nonce_pool(k_priv, depth)
+    try:
+        # Wait for the pool to fill, so the signatures below take their k from it
+        deadline = time.monotonic() + 10
+        while nonce_pool.get_metrics()["depth"] < depth and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        sigs = [UAB_ElGamal_sign(k_priv, m, nonce_pool=nonce_pool) for m in range(num_signatures)]
+        t1 = all(UAB_ElGamal_verify(sig, k_pub, m) for m, sig in enumerate(sigs))
+        # No k is used twice, so no two signatures share r
+        t2 = len(set(sig[0] for sig in sigs)) == num_signatures
+        t3 = UAB_ElGamal_sign(other_priv, 1, nonce_pool=nonce_pool) is None or tuple(other_priv) == tuple(k_priv)
+
+        metrics = nonce_pool.get_metrics()
+        t4 = metrics["capacity"] == depth and metrics["consumed"] + metrics["misses"] == num_signatures
+        t5 = metrics["consumed"] >= min(depth, num_signatures) and metrics["produced"] >= metrics["consumed"]
+    finally:
+        nonce_pool.stop()
+    t6 = not nonce_pool.thread.is_alive()
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5 & t6)
+
+def test_case_8(name, num_bits, num_signatures, num_workers, chunk_size):
+    [k_priv, k_pub] = UAB_generate_ElGamal_keys(num_bits, cached=True)
+    messages = (m * m + 1 for m in range(num_signatures))
+    sigs = list(UAB_ElGamal_sign_bulk(k_priv, messages, num_workers, chunk_size))
+
+    # In input order, all valid, and the workers never draw the same k
+    t1 = len(sigs) == num_signatures
+    t2 = all(UAB_ElGamal_verify(sig, k_pub, m * m + 1) for m, sig in enumerate(sigs))
+    t3 = len(set(sig[0] for sig in sigs)) == num_signatures
+    t4 = list(UAB_ElGamal_sign_bulk(k_priv, [], num_workers, chunk_size)) == []
+    print("Test", name + ":", t1 & t2 & t3 & t4)
+
+def test_case_9(name, limit):
+    # utils.backend against trial division, and on composites that fool weaker tests: Carmichael numbers (the last
+    # one has no factor below 1000, so Miller-Rabin has to catch it) and strong pseudoprimes to the first 9, 12 and 13
+    # prime bases
+    t1 = all(Integer(n).is_prime() == (n > 1 and all(n % d != 0 for d in range(2, int(n ** 0.5) + 1)))
+             for n in range(limit))
+    pseudoprimes = [561, 1105, 1729, 2465, 2821, 6601, 8911, 9624742921, 2047, 3215031751, 3825123056546413051,
+                    318665857834031151167461, 3317044064679887385961981]
+    t2 = not any(Integer(n).is_prime() for n in pseudoprimes)
+    t3 = Integer(2 ** 127 - 1).is_prime() and next_prime(2 ** 89 - 2) == 2 ** 89 - 1
+    print("Test", name + ":", t1 & t2 & t3)
+
+def test_case_10(name, limit):
+    # factor, euler_phi and primitive_root of utils.backend against the naive definitions
+    t1 = t2 = t3 = True
+    for n in range(1, limit):
+        factors = factor(n)
+        product = 1
+        for p, e in factors:
+            product *= p ** e
+        t1 &= product == n and all(Integer(p).is_prime() for p, e in factors) and factors == sorted(factors)
+        t2 &= euler_phi(n) == sum(1 for x in range(1, n + 1) if Integer(x).gcd(n) == 1)
+
+        units = [x for x in range(1, n) if Integer(x).gcd(n) == 1] if n > 1 else [0]
+        generators = [g for g in units if len(set(power_mod(g, k, n) for k in range(len(units)))) == len(units)]
+        try:
+            root = primitive_root(n)
+            t3 &= len(generators) > 0 and root == generators[0]
+        except ValueError:
+            t3 &= len(generators) == 0
+
+    # Large enough factors for Pollard's rho, and the errors of factor
+    t4 = factor(1000003 * 1000033 ** 2) == [(1000003, 1), (1000033, 2)] and factor(-12) == [(2, 2), (3, 1)]
+    try:
+        factor(0)
+        t4 = False
+    except ArithmeticError:
+        pass
+    print("Test", name + ":", t1 & t2 & t3 & t4)
+
+def test_case_11(name, num_draws):
+    # random_prime of utils.backend stays within [lbound, n] and fails when there is no prime there
+    t1 = True
+    for (n, lbound) in [(3, 2), (13, 13), (100, 90), (2 ** 64, 2 ** 63)]:
+        for i in range(num_draws):
+            p = random_prime(n, False, lbound)
+            t1 &= lbound <= p <= n and Integer(p).is_prime() and type(p) is Integer
+
+    t2 = True
+    for (n, lbound) in [(10, 8), (5, 6), (1, 0)]:
+        try:
+            random_prime(n, False, lbound)
+            t2 = False
+        except ValueError:
+            pass
+
+    # Integer arithmetic stays Integer, with ints on either side, except for the true division
+    a, b = Integer(17), Integer(5)
+    results = [a // b, a % b, a ** b, 17 // b, 17 % b, 2 ** b, pow(a, b, 7), -a, a << 3]
+    results += list(divmod(a, b)) + list(divmod(17, b)) + list(divmod(a, 5))
+    t3 = all(type(x) is Integer for x in results) and results[:3] == [3, 2, 1419857] and results[-2:] == [3, 2]
+    t3 &= type(a / b) is float
+    print("Test", name + ":", t1 & t2 & t3)
+
 def practica3():
     exp_k_priv = (1736419493, 423105914, 1439798331)
     k_pub = (1736419493, 423105914, 1388681513)
@@ -179,3 +944,33 @@ def practica3():
     sig1 = (1629150615, 2477614166)
     sig2 = (1462514112, 61485630)
     test_case_2("2.10", k_pub, m1, sig1, m2, sig2, exp_k_priv)
+
+    # Same m with s differing by (p - 1) / 2: both cannot be valid, and solving would try (p - 1) / 2 values of k
+    exp_k_priv = -1
+    k_pub = (1736419493, 423105914, 1388681513)
+    m1, m2 = 4321, 4321
+    sig1 = (1670801833, 813531998)
+    sig2 = (1670801833, 813531998 + (1736419493 - 1) // 2)
+    test_case_2("2.11", k_pub, m1, sig1, m2, sig2, exp_k_priv)
+
+    test_case_3("3.1", 128, 32, False)
+    test_case_3("3.2", 128, 32, True)
+
+    test_case_4("4.1", 3, 20, 1000, 4)
+    test_case_4("4.2", 3, 20, 4, 2)
+
+    test_case_5("5.1", 64)
+    test_case_5("5.2", 128)
+
+    test_case_6("6.1", 64, FIXED_BASE_WINDOW)
+    test_case_6("6.2", 128, 3)
+
+    test_case_7("7.1", 64, 8, 4)
+    test_case_7("7.2", 128, 8, 50)
+
+    test_case_8("8.1", 64, 100, 2, 7)
+    test_case_8("8.2", 128, 300, 3, 16)
+
+    test_case_9("9.1", 20000)
+    test_case_10("10.1", 200)
+    test_case_11("11.1", 20)
@@ -1,4 +1,4 @@
-from sage.all import *
+from utils.backend import *
 
 MAX_TARGET = "F" * 64
 
@@ -19,6 +19,38 @@ def UAB_concatenate_ints_as_strings(list):
     return "".join(str(e) for e in list)
 
 
+from datetime import datetime, timedelta, timezone
+import hashlib
+import struct
+
+# Fixed-width binary wire format (big-endian):
+#   transaction   transaction_hash (32 bytes)
+#   block header  version (4), flags (1), previous_block_hash (32), merkle_root (32),
+#                 time as microseconds since BINARY_EPOCH (8), target (32), nonce (8)
+#   block         block header, number of transactions (4), transactions
+# The flags tell which of the optional header fields are set. Hashes are decoded as lower case hex and targets as
+# upper case hex, which is how this module writes them, and times as naive datetimes, so decoded structures keep their
+# string serialization. Headers with fields in any other form are rejected with ValueError instead of being stored.
+BINARY_EPOCH = datetime(1970, 1, 1)
+BLOCK_HEADER_FORMAT = struct.Struct(">IB32s32sq32sQ")
+BLOCK_TX_COUNT_FORMAT = struct.Struct(">I")
+TRANSACTION_SIZE = 32
+HAS_PREVIOUS_BLOCK_HASH = 1
+HAS_MERKLE_ROOT = 2
+HAS_TIME = 4
+HAS_TARGET = 8
+HAS_NONCE = 16
+
+
+# Get the 32 bytes of a hash or target field, which must be the 64 hex digits this module writes: lower case for
+# hashes, upper case for targets. Any other form would decode to a different string and change the block hash.
+def UAB_hex_field_to_bytes(value, name, upper=False):
+    hex_digits = "0123456789ABCDEF" if upper else "0123456789abcdef"
+    if not isinstance(value, str) or len(value) != 64 or any(digit not in hex_digits for digit in value):
+        raise ValueError("%s must be 64 %s case hex digits, got %r" % (name, "upper" if upper else "lower", value))
+    return bytes.fromhex(value)
+
+
 #########################################################################################
 #
 # DATA STRUCTURES
@@ -27,6 +59,7 @@ def UAB_concatenate_ints_as_strings(list):
 
 # Transaction structure
 class transaction_struct():
+    __slots__ = ("transaction_hash",)
 
     # Initialize
     def __init__(self, h=None):
@@ -44,6 +77,10 @@ class transaction_struct():
     def serialize(self):
         return UAB_concatenate_ints_as_strings([self.transaction_hash])
 
+    # Serialize transaction structure in the binary wire format
+    def serialize_binary(self):
+        return UAB_hex_field_to_bytes(self.transaction_hash, "transaction_hash")
+
     # Get transaction hash
     def get_hash(self):
         return self.transaction_hash
@@ -51,6 +88,7 @@ class transaction_struct():
 
 # Block header structure
 class block_header_struct():
+    __slots__ = ("version", "previous_block_hash", "merkle_root", "time", "target", "nonce")
 
     # Initialize
     def __init__(self):
@@ -76,9 +114,36 @@ class block_header_struct():
         s = [self.version, self.previous_block_hash, self.merkle_root, self.time, self.target, self.nonce]
         return UAB_concatenate_ints_as_strings(s)
 
+    # Serialize block header in the binary wire format
+    def serialize_binary(self):
+        flags = 0
+        previous_block_hash = merkle_root = target = bytes(32)
+        time = nonce = 0
+
+        if self.previous_block_hash is not None:
+            flags |= HAS_PREVIOUS_BLOCK_HASH
+            previous_block_hash = UAB_hex_field_to_bytes(self.previous_block_hash, "previous_block_hash")
+        if self.merkle_root is not None:
+            flags |= HAS_MERKLE_ROOT
+            merkle_root = UAB_hex_field_to_bytes(self.merkle_root, "merkle_root")
+        if self.time is not None:
+            if not isinstance(self.time, datetime) or self.time.tzinfo is not None:
+                raise ValueError("time must be a naive datetime, got %r" % (self.time,))
+            flags |= HAS_TIME
+            time = (self.time - BINARY_EPOCH) // timedelta(microseconds=1)
+        if self.target is not None:
+            flags |= HAS_TARGET
+            target = UAB_hex_field_to_bytes(self.target, "target", upper=True)
+        if self.nonce is not None:
+            flags |= HAS_NONCE
+            nonce = self.nonce
+
+        return BLOCK_HEADER_FORMAT.pack(self.version, flags, previous_block_hash, merkle_root, time, target, nonce)
+
 
 # Block structure
 class block_struct():
+    __slots__ = ("block_header", "txs")
 
     # Initialize
     def __init__(self):
@@ -97,11 +162,59 @@ class block_struct():
         s = [self.block_header, self.txs]
         return UAB_concatenate_ints_as_strings(s)
 
-    # Get block hash
-    def get_hash(self):
+    # Serialize block in the binary wire format
+    def serialize_binary(self):
+        txs = b"".join(tx.serialize_binary() for tx in self.txs)
+        return self.block_header.serialize_binary() + BLOCK_TX_COUNT_FORMAT.pack(len(self.txs)) + txs
+
+    # Get block hash. The string serialization is the default, binary=True hashes the binary wire format instead
+    def get_hash(self, binary=False):
+        if binary:
+            return hashlib.sha256(self.block_header.serialize_binary()).hexdigest()
         return UAB_btc_hash(self.block_header.serialize())
 
 
+# Decode a transaction_struct in the binary wire format from buffer (any bytes-like object) at offset
+def UAB_decode_transaction(buffer, offset=0):
+    return transaction_struct(memoryview(buffer)[offset:offset + TRANSACTION_SIZE].hex())
+
+
+# Decode a block_header_struct in the binary wire format from buffer at offset
+def UAB_decode_block_header(buffer, offset=0):
+    version, flags, previous_block_hash, merkle_root, time, target, nonce = \
+        BLOCK_HEADER_FORMAT.unpack_from(buffer, offset)
+
+    header = block_header_struct()
+    header.version = version
+    if flags & HAS_PREVIOUS_BLOCK_HASH:
+        header.previous_block_hash = previous_block_hash.hex()
+    if flags & HAS_MERKLE_ROOT:
+        header.merkle_root = merkle_root.hex()
+    if flags & HAS_TIME:
+        header.time = BINARY_EPOCH + timedelta(microseconds=time)
+    if flags & HAS_TARGET:
+        header.target = "%064X" % int.from_bytes(target, byteorder='big')
+    if flags & HAS_NONCE:
+        header.nonce = nonce
+    return header
+
+
+# Decode a block_struct in the binary wire format from buffer at offset. Transaction hashes are read straight from
+# a memoryview of buffer, without slicing copies
+def UAB_decode_block(buffer, offset=0):
+    view = memoryview(buffer)
+    block = block_struct()
+    block.block_header = UAB_decode_block_header(view, offset)
+
+    offset += BLOCK_HEADER_FORMAT.size
+    num_txs = BLOCK_TX_COUNT_FORMAT.unpack_from(view, offset)[0]
+    offset += BLOCK_TX_COUNT_FORMAT.size
+    for i in range(num_txs):
+        block.txs.append(transaction_struct(view[offset:offset + TRANSACTION_SIZE].hex()))
+        offset += TRANSACTION_SIZE
+    return block
+
+
 # Blockchain structure
 class blockchain_struct():
 
@@ -122,6 +235,226 @@ class blockchain_struct():
     def get_blocks(self):
         return self.blocks
 
+
+import collections.abc
+import mmap
+import os
+import tempfile
+
+BLOCK_STORE_HEADER = struct.Struct("<Q")
+BLOCK_STORE_ENTRY = struct.Struct("<QQ32s")  # offset and length of the block record, block hash
+BLOCK_STORE_SLOT = struct.Struct("<Q")  # height + 1, 0 for an empty slot
+BLOCK_STORE_INITIAL_CAPACITY = 1024
+
+
+# Open (creating it if needed) a file of at least size bytes and memory-map it
+def UAB_map_file(path, size, read_only=False):
+    if read_only:
+        f = open(path, "rb")
+        return f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    f = open(path, "a+b")
+    if os.path.getsize(path) < size:
+        f.truncate(size)
+    return f, mmap.mmap(f.fileno(), 0)
+
+
+# Blockchain stored on disk, with the same interface as blockchain_struct. Blocks are appended to <path>.blk in the
+# binary wire format and two memory-mapped indexes are kept next to it:
+#   <path>.idx   number of blocks, then a fixed-width (offset, length, hash) entry per height
+#   <path>.hidx  number of indexed blocks and capacity, then an open-addressing table of heights keyed by block hash
+# A block only counts once the block count in <path>.idx is updated, so opening a store is O(1) and a crash in the
+# middle of add_block just drops the half-written block. The hash table is only ever changed by filling empty slots;
+# when it grows, the bigger table is built in a new file that atomically replaces <path>.hidx. A read_only store can
+# therefore be opened by several processes while another one appends to it: each reader sees the blocks stored when
+# it was opened.
+class block_store_struct():
+
+    # Initialize
+    def __init__(self, path, read_only=False):
+        self.path = path
+        self.read_only = read_only
+        self.blk_file = open(path + ".blk", "rb" if read_only else "a+b")
+
+        size = BLOCK_STORE_HEADER.size + BLOCK_STORE_INITIAL_CAPACITY * BLOCK_STORE_ENTRY.size
+        self.idx_file, self.idx = UAB_map_file(path + ".idx", size, read_only)
+        self.num_blocks = BLOCK_STORE_HEADER.unpack_from(self.idx, 0)[0]
+
+        size = 2 * BLOCK_STORE_HEADER.size + 2 * BLOCK_STORE_INITIAL_CAPACITY * BLOCK_STORE_SLOT.size
+        self.hidx_file, self.hidx = UAB_map_file(path + ".hidx", size, read_only)
+        num_indexed, capacity = struct.unpack_from("<QQ", self.hidx, 0)
+        self.capacity = capacity
+        if read_only:
+            # A block counted but not hashed yet is left for a later reader
+            self.num_blocks = min(self.num_blocks, num_indexed)
+            return
+
+        if capacity == 0:
+            capacity = 2 * BLOCK_STORE_INITIAL_CAPACITY
+            struct.pack_into("<QQ", self.hidx, 0, 0, capacity)
+        self.capacity = capacity
+
+        # Drop whatever an interrupted add_block left behind
+        end = 0
+        if self.num_blocks > 0:
+            offset, length, block_hash = self.get_entry(self.num_blocks - 1)
+            end = offset + length
+        self.blk_file.truncate(end)
+        for height in range(min(num_indexed, self.num_blocks), self.num_blocks):
+            self.index_hash(height)
+
+    # Close the underlying files
+    def close(self):
+        if not self.read_only:
+            self.idx.flush()
+            self.hidx.flush()
+        self.idx.close()
+        self.hidx.close()
+        self.idx_file.close()
+        self.hidx_file.close()
+        self.blk_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # Get the number of blocks
+    def __len__(self):
+        return self.num_blocks
+
+    # Show blockchain content
+    def print_me(self):
+        for block in self.get_blocks():
+            block.print_me()
+
+    # Get the (offset, length, hash) index entry of the block at height
+    def get_entry(self, height):
+        return BLOCK_STORE_ENTRY.unpack_from(self.idx, BLOCK_STORE_HEADER.size + height * BLOCK_STORE_ENTRY.size)
+
+    # Add a new block to the blockchain
+    def add_block(self, block):
+        record = block.serialize_binary()
+        block_hash = bytes.fromhex(block.get_hash())
+
+        offset = self.blk_file.seek(0, os.SEEK_END)
+        self.blk_file.write(record)
+        self.blk_file.flush()
+
+        entry_offset = BLOCK_STORE_HEADER.size + self.num_blocks * BLOCK_STORE_ENTRY.size
+        if entry_offset + BLOCK_STORE_ENTRY.size > len(self.idx):
+            self.idx.close()
+            self.idx_file.truncate(2 * entry_offset)
+            self.idx = mmap.mmap(self.idx_file.fileno(), 0)
+        BLOCK_STORE_ENTRY.pack_into(self.idx, entry_offset, offset, len(record), block_hash)
+
+        self.num_blocks += 1
+        BLOCK_STORE_HEADER.pack_into(self.idx, 0, self.num_blocks)
+        self.index_hash(self.num_blocks - 1)
+
+    # Get the block at height (negative heights count from the top, as in a list)
+    def get_block(self, height):
+        if height < 0:
+            height += self.num_blocks
+        if not 0 <= height < self.num_blocks:
+            raise IndexError("block height out of range")
+
+        offset, length, block_hash = self.get_entry(height)
+        return UAB_decode_block(os.pread(self.blk_file.fileno(), length, offset))
+
+    # Get the hex hash of the block at height from the index, without reading the block
+    def get_block_hash(self, height):
+        if not 0 <= height < self.num_blocks:
+            raise IndexError("block height out of range")
+        return self.get_entry(height)[2].hex()
+
+    # Get block list, as a read-only sequence that loads blocks from disk on access
+    def get_blocks(self):
+        return block_store_view(self)
+
+    # Get the height of the block with the given hex hash, or None if it is not stored
+    def get_height(self, block_hash):
+        block_hash = bytes.fromhex(block_hash)
+        mask = self.capacity - 1
+        slot = int.from_bytes(block_hash[:8], byteorder='little') & mask
+
+        while True:
+            height = BLOCK_STORE_SLOT.unpack_from(self.hidx, self.slot_offset(slot))[0] - 1
+            if height < 0:
+                return None
+            if height < self.num_blocks and self.get_entry(height)[2] == block_hash:
+                return height
+            slot = (slot + 1) & mask
+
+    # Get the block with the given hex hash, or None if it is not stored
+    def get_block_by_hash(self, block_hash):
+        height = self.get_height(block_hash)
+        if height is None:
+            return None
+        return self.get_block(height)
+
+    # Get the position of a slot in <path>.hidx
+    def slot_offset(self, slot):
+        return 2 * BLOCK_STORE_HEADER.size + slot * BLOCK_STORE_SLOT.size
+
+    # Add the block at height to the hash table, doubling it when it gets half full
+    def index_hash(self, height):
+        if 2 * (height + 1) > self.capacity:
+            self.rebuild_hash_index(2 * self.capacity, height)
+
+        self.insert_slot(height)
+        struct.pack_into("<QQ", self.hidx, 0, height + 1, self.capacity)
+
+    # Build a hash table of the given capacity with the blocks below height in a new file and move it over
+    # <path>.hidx. Readers keep the old table, which stays valid, and a crash leaves either table complete.
+    def rebuild_hash_index(self, capacity, height):
+        path = self.path + ".hidx"
+        hidx_file = open(path + ".tmp", "w+b")
+        hidx_file.truncate(self.slot_offset(capacity))
+        hidx = mmap.mmap(hidx_file.fileno(), 0)
+        struct.pack_into("<QQ", hidx, 0, height, capacity)
+
+        self.hidx.close()
+        self.hidx_file.close()
+        self.hidx_file, self.hidx, self.capacity = hidx_file, hidx, capacity
+        for indexed_height in range(height):
+            self.insert_slot(indexed_height)
+
+        self.hidx.flush()
+        os.fsync(self.hidx_file.fileno())
+        os.replace(path + ".tmp", path)
+
+    # Write height into the first free slot of its probe sequence, unless it is already there (re-indexing after a
+    # crash between insert_slot and the header update)
+    def insert_slot(self, height):
+        mask = self.capacity - 1
+        slot = int.from_bytes(self.get_entry(height)[2][:8], byteorder='little') & mask
+        while True:
+            stored = BLOCK_STORE_SLOT.unpack_from(self.hidx, self.slot_offset(slot))[0]
+            if stored == height + 1:
+                return
+            if stored == 0:
+                break
+            slot = (slot + 1) & mask
+        BLOCK_STORE_SLOT.pack_into(self.hidx, self.slot_offset(slot), height + 1)
+
+
+# Read-only list of the blocks of a block_store_struct, loading each block from disk when it is accessed
+class block_store_view(collections.abc.Sequence):
+
+    # Initialize
+    def __init__(self, store):
+        self.store = store
+
+    def __len__(self):
+        return len(self.store)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.store.get_block(height) for height in range(*index.indices(len(self.store)))]
+        return self.store.get_block(index)
+
 class merkle_node():
     def __init__(self, transaction_hash, father=None, left=None, right=None):
         self.father = father
@@ -185,13 +518,233 @@ def UAB_validate_inclusion_simplified(tx, merkle_root, merkle_path):
     return start_node.transaction_hash == merkle_root
 
 
-from datetime import datetime
+# Validate many (tx, merkle_path) proofs against the same merkle_root. Every interior hash is memoized by its pair of
+# children, so the upper nodes the proofs share are hashed only once and a whole block's proofs cost about as much
+# as building its tree. Returns one boolean per proof, in order.
+def UAB_validate_inclusion_batch(merkle_root, proofs):
+    hashes = {}
+    results = []
+
+    for tx, merkle_path in proofs:
+        current_hash = tx.transaction_hash
+        for element in merkle_path:
+            if element[0] == 0:
+                children = (current_hash, element[1])
+            else:
+                children = (element[1], current_hash)
+
+            parent_hash = hashes.get(children)
+            if parent_hash is None:
+                parent_hash = UAB_btc_hash(UAB_concatenate_ints_as_strings(children))
+                hashes[children] = parent_hash
+            current_hash = parent_hash
+
+        results.append(current_hash == merkle_root)
+
+    return results
+
+
+import binascii
+
+MERKLE_DIGEST_SIZE = 32
+
+
+# Hash two raw Merkle digests the way UAB_create_tree does, i.e. over the concatenation of their hex strings
+def UAB_merkle_hash_pair(left, right):
+    return hashlib.sha256(binascii.hexlify(left + right)).digest()
+
+
+# Merkle tree stored level by level (level 0 holds the leaves, the last level the root) in contiguous bytearrays
+# of 32-byte digests. As in UAB_compute_merkle_root the leaves are padded to a power of two by repeating the last
+# one, but padding nodes are never stored: each level keeps its real nodes plus the digest its padding nodes share.
+class merkle_tree_struct():
+
+    # Initialize from a list of transaction_struct
+    def __init__(self, tx_list=()):
+        leaves = bytearray()
+        for tx in tx_list:
+            leaves += bytes.fromhex(tx.transaction_hash)
+        self.levels = [leaves]
+        self.paddings = []
+        self.build()
+
+    # Recompute every level above the leaves
+    def build(self):
+        del self.levels[1:]
+        leaves = self.levels[0]
+        self.paddings = [bytes(leaves[-MERKLE_DIGEST_SIZE:])] if leaves else []
+
+        level = 0
+        while len(self.levels[level]) > MERKLE_DIGEST_SIZE:
+            nodes = self.levels[level]
+            padding = self.paddings[level]
+            parents = bytearray()
+            for i in range(0, len(nodes), 2 * MERKLE_DIGEST_SIZE):
+                if i + 2 * MERKLE_DIGEST_SIZE <= len(nodes):
+                    parents += hashlib.sha256(binascii.hexlify(nodes[i:i + 2 * MERKLE_DIGEST_SIZE])).digest()
+                else:
+                    parents += UAB_merkle_hash_pair(nodes[i:], padding)
+            self.levels.append(parents)
+            self.paddings.append(UAB_merkle_hash_pair(padding, padding))
+            level += 1
+
+    # Get the number of leaves (without padding)
+    def get_size(self):
+        return len(self.levels[0]) // MERKLE_DIGEST_SIZE
+
+    # Get the raw digest of a node, padding nodes included
+    def get_node(self, level, index):
+        offset = index * MERKLE_DIGEST_SIZE
+        nodes = self.levels[level]
+        if offset >= len(nodes):
+            return self.paddings[level]
+        return bytes(nodes[offset:offset + MERKLE_DIGEST_SIZE])
+
+    # Get the merkle root as a hex string
+    def get_root(self):
+        if self.get_size() == 0:
+            return UAB_btc_hash("")
+        return self.levels[-1].hex()
+
+    # Get the merkle path of the leaf at index, as accepted by UAB_validate_inclusion_simplified
+    def get_merkle_path(self, index):
+        if not 0 <= index < self.get_size():
+            return None
+
+        merkle_path = []
+        for level in range(len(self.levels) - 1):
+            merkle_path.append((index & 1, self.get_node(level, index ^ 1).hex()))
+            index >>= 1
+        return merkle_path
+
+    # Recompute the ancestors of the leaf at index, resizing the levels to the current number of leaves. If it is
+    # the last leaf the paddings are recomputed too. Costs O(log n) hashes.
+    def update_path(self, index):
+        n = self.get_size()
+        depth = 0 if n <= 1 else (n - 1).bit_length()
+        del self.levels[depth + 1:]
+        while len(self.levels) <= depth:
+            self.levels.append(bytearray())
+
+        if n == 0:
+            self.paddings = []
+            return
+
+        if index == n - 1:
+            self.paddings = [bytes(self.levels[0][-MERKLE_DIGEST_SIZE:])]
+            for level in range(depth):
+                self.paddings.append(UAB_merkle_hash_pair(self.paddings[level], self.paddings[level]))
+
+        for level in range(depth):
+            parent = index >> 1
+            new_hash = UAB_merkle_hash_pair(self.get_node(level, 2 * parent), self.get_node(level, 2 * parent + 1))
+
+            parents = self.levels[level + 1]
+            num_parents = (n + (1 << (level + 1)) - 1) >> (level + 1)
+            if len(parents) > num_parents * MERKLE_DIGEST_SIZE:
+                del parents[num_parents * MERKLE_DIGEST_SIZE:]
+            elif len(parents) < num_parents * MERKLE_DIGEST_SIZE:
+                parents.extend(bytes(num_parents * MERKLE_DIGEST_SIZE - len(parents)))
+            parents[parent * MERKLE_DIGEST_SIZE:(parent + 1) * MERKLE_DIGEST_SIZE] = new_hash
+            index = parent
+
+    # Add a leaf (raw digest) at the end
+    def append_leaf(self, leaf):
+        self.levels[0] += leaf
+        self.update_path(self.get_size() - 1)
+
+    # Replace the leaf (raw digest) at index
+    def set_leaf(self, index, leaf):
+        self.levels[0][index * MERKLE_DIGEST_SIZE:(index + 1) * MERKLE_DIGEST_SIZE] = leaf
+        self.update_path(index)
+
+    # Remove the last leaf and return it
+    def pop_leaf(self):
+        leaf = bytes(self.levels[0][-MERKLE_DIGEST_SIZE:])
+        del self.levels[0][-MERKLE_DIGEST_SIZE:]
+        self.update_path(self.get_size() - 1)
+        return leaf
+
+
+# Pool of pending transactions, deduplicated by transaction_hash, whose merkle root is kept up to date in O(log n)
+# hashes per insert or remove. Removing moves the last transaction into the freed slot, so txs keeps the insertion
+# order only until the first removal.
+class mempool_struct():
 
-def UAB_blockchain_mine(blk_chain, tx_list, target=MAX_TARGET):
+    # Initialize
+    def __init__(self):
+        self.txs = []
+        self.positions = {}
+        self.tree = merkle_tree_struct()
+
+    # Get the number of pending transactions
+    def __len__(self):
+        return len(self.txs)
+
+    # Check whether a transaction hash is pending
+    def __contains__(self, transaction_hash):
+        return transaction_hash in self.positions
+
+    # Add a transaction. Returns False if it was already in the pool
+    def add_transaction(self, tx):
+        if tx.transaction_hash in self.positions:
+            return False
+
+        self.positions[tx.transaction_hash] = len(self.txs)
+        self.txs.append(tx)
+        self.tree.append_leaf(bytes.fromhex(tx.transaction_hash))
+        return True
+
+    # Remove a transaction by hash. Returns the removed transaction, or None if it was not in the pool
+    def remove_transaction(self, transaction_hash):
+        index = self.positions.pop(transaction_hash, None)
+        if index is None:
+            return None
+
+        tx = self.txs[index]
+        last_tx = self.txs.pop()
+        last_leaf = self.tree.pop_leaf()
+        if index < len(self.txs):
+            self.txs[index] = last_tx
+            self.positions[last_tx.transaction_hash] = index
+            self.tree.set_leaf(index, last_leaf)
+        return tx
+
+    # Get a copy of the pending transaction list, in merkle tree order
+    def get_transactions(self):
+        return list(self.txs)
+
+    # Get the merkle root of the pending transactions, as UAB_compute_merkle_root(self.get_transactions()) would
+    def get_merkle_root(self):
+        if len(self.txs) == 1:
+            return self.txs[0].transaction_hash
+        return self.tree.get_root()
+
+    # Mine a block with every pending transaction on top of blk_chain, reusing the maintained merkle root
+    def mine_block(self, blk_chain, target=MAX_TARGET):
+        return UAB_blockchain_mine(blk_chain, self.get_transactions(), target, merkle_root=self.get_merkle_root())
+
+
+# Get the merkle path of tx_list[index]
+def UAB_compute_merkle_path(tx_list, index):
+    return merkle_tree_struct(tx_list).get_merkle_path(index)
+
+
+
+import collections
+import itertools
+import multiprocessing
+
+# Nonces a parallel mining task tries
+MINING_BATCH_SIZE = 4096
+
+
+# Build the block to be mined on top of blk_chain, with its header nonce set to 0.
+# merkle_root can be given when it is already known (see mempool_struct) to skip computing it.
+def UAB_build_block_template(blk_chain, tx_list, target=MAX_TARGET, merkle_root=None):
     header = block_header_struct()
     header.time = datetime.now()
-    copy_list = tx_list.copy()  # To no alterate the original list
-    header.merkle_root = UAB_compute_merkle_root(copy_list)
+    header.merkle_root = UAB_compute_merkle_root(tx_list) if merkle_root is None else merkle_root
     header.nonce = 0
     header.target = target
 
@@ -204,18 +757,393 @@ def UAB_blockchain_mine(blk_chain, tx_list, target=MAX_TARGET):
     new_block = block_struct()
     new_block.txs = tx_list
     new_block.block_header = header
-    hash_to_calculate = header.serialize()
-    hash_to_calculate = UAB_btc_hash(hash_to_calculate)
-    integer_hash = UAB_hexString_to_int(hash_to_calculate)
+    return new_block
+
+
+# Serialize every header field but the nonce, which always comes last in block_header_struct.serialize
+def UAB_header_prefix(header):
+    s = [header.version, header.previous_block_hash, header.merkle_root, header.time, header.target]
+    return UAB_concatenate_ints_as_strings(s)
+
+
+# Decode a hex target into the 32 big-endian bytes raw SHA256 digests are compared against.
+# Returns None when the target is above every possible digest.
+def UAB_target_to_bytes(target):
+    integer_target = UAB_hexString_to_int(target)
+    if integer_target >= 2 ** 256:
+        return None
+    return integer_target.to_bytes(32, byteorder='big')
+
+
+# Look for the first nonce in range(start, stop, step) (unbounded if stop is None) whose header hash is below the
+# target. prefix_hash is a hashlib.sha256 object already fed with UAB_header_prefix(header), so each try only copies
+# that state and hashes the nonce digits. Returns (nonce, tried), with nonce None if the range was exhausted.
+def UAB_search_nonce(prefix_hash, target_bytes, start=0, stop=None, step=1):
+    if target_bytes is None:
+        return start, 1
+
+    nonces = itertools.count(start, step) if stop is None else range(start, stop, step)
+    copy_state = prefix_hash.copy
+    tried = 0
+    for nonce in nonces:
+        tried += 1
+        h = copy_state()
+        h.update(b"%d" % nonce)
+        if h.digest() < target_bytes:
+            return nonce, tried
+
+    return None, tried
+
+
+SHA256_INITIAL_STATE = [0x6a09e667, 0xbb67ae85, 0x3c6ef372, 0xa54ff53a, 0x510e527f, 0x9b05688c, 0x1f83d9ab, 0x5be0cd19]
+SHA256_ROUND_CONSTANTS = [
+    0x428a2f98, 0x71374491, 0xb5c0fbcf, 0xe9b5dba5, 0x3956c25b, 0x59f111f1, 0x923f82a4, 0xab1c5ed5,
+    0xd807aa98, 0x12835b01, 0x243185be, 0x550c7dc3, 0x72be5d74, 0x80deb1fe, 0x9bdc06a7, 0xc19bf174,
+    0xe49b69c1, 0xefbe4786, 0x0fc19dc6, 0x240ca1cc, 0x2de92c6f, 0x4a7484aa, 0x5cb0a9dc, 0x76f988da,
+    0x983e5152, 0xa831c66d, 0xb00327c8, 0xbf597fc7, 0xc6e00bf3, 0xd5a79147, 0x06ca6351, 0x14292967,
+    0x27b70a85, 0x2e1b2138, 0x4d2c6dfc, 0x53380d13, 0x650a7354, 0x766a0abb, 0x81c2c92e, 0x92722c85,
+    0xa2bfe8a1, 0xa81a664b, 0xc24b8b70, 0xc76c51a3, 0xd192e819, 0xd6990624, 0xf40e3585, 0x106aa070,
+    0x19a4c116, 0x1e376c08, 0x2748774c, 0x34b0bcb5, 0x391c0cb3, 0x4ed8aa4a, 0x5b9cca4f, 0x682e6ff3,
+    0x748f82ee, 0x78a5636f, 0x84c87814, 0x8cc70208, 0x90befffa, 0xa4506ceb, 0xbef9a3f7, 0xc67178f2]
+
+# Nonces hashed together by UAB_search_nonce_vectorized
+VECTORIZED_BATCH_SIZE = 32768
+
+
+# The lane functions below take SHA256 words that are either a Python int, shared by every lane, or a NumPy uint32
+# array with one value per lane. Words that do not depend on the nonce stay ints, so the rounds and message schedule
+# words that only depend on them are computed once instead of once per lane.
+
+# rotr(x, r1) ^ rotr(x, r2) ^ rotr(x, r3), the big sigma functions of SHA256
+def UAB_lanes_rotr_xor(np, x, r1, r2, r3):
+    if isinstance(x, int):
+        return (((x >> r1) | (x << (32 - r1))) ^ ((x >> r2) | (x << (32 - r2))) ^ ((x >> r3) | (x << (32 - r3)))) \
+            & 0xFFFFFFFF
+
+    result = x >> r1
+    scratch = x << (32 - r1)
+    result ^= scratch
+    for r in (r2, r3):
+        np.right_shift(x, r, out=scratch)
+        result ^= scratch
+        np.left_shift(x, 32 - r, out=scratch)
+        result ^= scratch
+    return result
+
+
+# rotr(x, r1) ^ rotr(x, r2) ^ (x >> shift), the small sigma functions of the SHA256 message schedule
+def UAB_lanes_small_sigma(np, x, r1, r2, shift):
+    if isinstance(x, int):
+        return (((x >> r1) | (x << (32 - r1))) ^ ((x >> r2) | (x << (32 - r2))) ^ (x >> shift)) & 0xFFFFFFFF
+
+    result = x >> shift
+    scratch = x >> r1
+    result ^= scratch
+    np.left_shift(x, 32 - r1, out=scratch)
+    result ^= scratch
+    np.right_shift(x, r2, out=scratch)
+    result ^= scratch
+    np.left_shift(x, 32 - r2, out=scratch)
+    result ^= scratch
+    return result
+
+
+# Sum modulo 2^32 of values, adding all the ints first so the arrays get a single constant
+def UAB_lanes_add(np, *values):
+    constant = sum(value for value in values if isinstance(value, int)) & 0xFFFFFFFF
+    arrays = [value for value in values if not isinstance(value, int)]
+    if len(arrays) == 0:
+        return constant
+
+    result = arrays[0] + (arrays[1] if len(arrays) > 1 else np.uint32(constant))
+    for array in arrays[2:]:
+        result += array
+    if len(arrays) > 1 and constant != 0:
+        result += np.uint32(constant)
+    return result
+
+
+# SHA256 message schedule of the 16 words of a block. Entries of known that are not None are words already computed
+# for this message layout and are taken as they are.
+def UAB_sha256_schedule_vectorized(np, words, known=None):
+    w = list(words)
+    for i in range(16, 64):
+        if known is not None and known[i] is not None:
+            w.append(known[i])
+        else:
+            w.append(UAB_lanes_add(np, w[i - 16], UAB_lanes_small_sigma(np, w[i - 15], 7, 18, 3), w[i - 7],
+                                   UAB_lanes_small_sigma(np, w[i - 2], 17, 19, 10)))
+    return w
+
+
+# Rounds first to 63 of a SHA256 compression from the working variables state, without the final addition of the
+# input state. ch and maj are computed as ((f ^ g) & e) ^ g and ((a ^ b) & (b ^ c)) ^ b, reusing the a ^ b of a round
+# as the b ^ c of the next one.
+def UAB_sha256_rounds_vectorized(np, state, w, first=0):
+    a, b, c, d, e, f, g, h = state
+    b_xor_c = b ^ c
+    for i in range(first, 64):
+        choose = f ^ g
+        choose = e & choose if isinstance(choose, int) else np.bitwise_and(choose, e, out=choose)
+        choose ^= g
+        t1 = UAB_lanes_add(np, h, UAB_lanes_rotr_xor(np, e, 6, 11, 25), choose, SHA256_ROUND_CONSTANTS[i], w[i])
+
+        a_xor_b = a ^ b
+        majority = a_xor_b & b_xor_c
+        majority ^= b
+        t2 = UAB_lanes_add(np, UAB_lanes_rotr_xor(np, a, 2, 13, 22), majority)
+
+        h, g, f, e, d, c, b, a = g, f, e, UAB_lanes_add(np, d, t1), c, b, a, UAB_lanes_add(np, t1, t2)
+        b_xor_c = a_xor_b
+    return [a, b, c, d, e, f, g, h]
+
+
+# Nonce-independent part of hashing prefix + nonce for nonces of num_digits digits: the padded tail blocks with the
+# digit bytes set to "0", the index of the words holding digits, the schedule words that do not depend on them, and
+# the working variables after the rounds of the first tail block that come before the first digit word.
+def UAB_nonce_search_plan(np, midstate, tail, message_bits, num_digits):
+    message_length = len(tail) + num_digits
+    num_blocks = (message_length + 9 + 63) // 64
+    message = bytearray(64 * num_blocks)
+    message[:len(tail)] = tail
+    message[len(tail):message_length] = b"0" * num_digits
+    message[message_length] = 0x80
+    message[-8:] = struct.pack(">Q", message_bits)
+    words = list(struct.unpack(">%dI" % (16 * num_blocks), bytes(message)))
+    digit_words = range(len(tail) // 4, (message_length - 1) // 4 + 1)
+
+    known = []
+    for block in range(num_blocks):
+        block_words = [None if 16 * block + i in digit_words else words[16 * block + i] for i in range(16)]
+        for i in range(16, 64):
+            inputs = [block_words[i - 16], block_words[i - 15], block_words[i - 7], block_words[i - 2]]
+            if any(word is None for word in inputs):
+                block_words.append(None)
+            else:
+                block_words.append(UAB_lanes_add(np, inputs[0], UAB_lanes_small_sigma(np, inputs[1], 7, 18, 3),
+                                                 inputs[2], UAB_lanes_small_sigma(np, inputs[3], 17, 19, 10)))
+        known.append(block_words)
+
+    first_round = digit_words[0]
+    state = list(midstate)
+    a, b, c, d, e, f, g, h = state
+    for i in range(first_round):
+        t1 = h + UAB_lanes_rotr_xor(np, e, 6, 11, 25) + (((f ^ g) & e) ^ g) + SHA256_ROUND_CONSTANTS[i] + words[i]
+        t2 = UAB_lanes_rotr_xor(np, a, 2, 13, 22) + (((a ^ b) & (b ^ c)) ^ b)
+        h, g, f, e, d, c, b, a = g, f, e, (d + t1) & 0xFFFFFFFF, c, b, a, (t1 + t2) & 0xFFFFFFFF
+    return words, digit_words, known, first_round, [a, b, c, d, e, f, g, h]
+
+
+# Same search as UAB_search_nonce, but the SHA256 compressions of batch_size consecutive nonces run at once over NumPy
+# uint32 lanes (CPU only), starting from the state left by the full 64-byte blocks of the header prefix. Only the
+# first digest word is compared for the whole batch, and the few nonces that may be below the target are checked with
+# hashlib in increasing order, so the nonce returned is the one UAB_search_nonce finds. prefix is
+# UAB_header_prefix(header).
+#
+# Even with the nonce-independent words and rounds computed once per header, each lane still needs about 2000 NumPy
+# operations per nonce, and on one core this runs at about the rate of the hashlib loop (within +-10% with batches of
+# 16384 to 32768 nonces), so UAB_blockchain_mine keeps using UAB_search_nonce. benchmarks/practica4_bench.py measures
+# both, together with UAB_blockchain_mine_parallel.
+def UAB_search_nonce_vectorized(prefix, target_bytes, start=0, stop=None, batch_size=VECTORIZED_BATCH_SIZE):
+    import numpy as np
+
+    if target_bytes is None:
+        return start, 1
+
+    data = prefix.encode('utf-8')
+    num_full_blocks = len(data) // 64
+    midstate = list(SHA256_INITIAL_STATE)
+    for block in range(num_full_blocks):
+        words = list(struct.unpack_from(">16I", data, 64 * block))
+        rounds = UAB_sha256_rounds_vectorized(np, midstate, UAB_sha256_schedule_vectorized(np, words))
+        midstate = [(x + y) & 0xFFFFFFFF for x, y in zip(midstate, rounds)]
+    tail = data[64 * num_full_blocks:]
+    target_word = struct.unpack_from(">I", target_bytes)[0]
+    prefix_hash = hashlib.sha256(data)
+
+    plans = {}
+    tried = 0
+    nonce = start
+    while stop is None or nonce < stop:
+        # Every nonce of a batch has the same number of digits, so they all pad to the same message layout
+        num_digits = len(str(nonce))
+        end = min(nonce + batch_size, 10 ** num_digits)
+        if stop is not None:
+            end = min(end, stop)
+        if num_digits not in plans:
+            plans[num_digits] = UAB_nonce_search_plan(np, midstate, tail, 8 * (len(data) + num_digits), num_digits)
+        words, digit_words, known, first_round, first_state = plans[num_digits]
+
+        # Add the value of every digit to the "0" of its byte in the digit words
+        nonces = np.arange(nonce, end, dtype=np.uint64)
+        words = list(words)
+        for i in digit_words:
+            words[i] = np.full(len(nonces), words[i], dtype=np.uint32)
+        for position in range(num_digits):
+            digit = ((nonces // np.uint64(10 ** (num_digits - 1 - position))) % np.uint64(10)).astype(np.uint32)
+            byte = len(tail) + position
+            digit <<= np.uint32(8 * (3 - byte % 4))
+            words[byte // 4] += digit
+
+        state = midstate
+        for block in range(len(known)):
+            w = UAB_sha256_schedule_vectorized(np, words[16 * block:16 * block + 16], known[block])
+            if block == 0:
+                rounds = UAB_sha256_rounds_vectorized(np, first_state, w, first_round)
+            else:
+                rounds = UAB_sha256_rounds_vectorized(np, state, w)
+            if block == len(known) - 1:
+                first_word = UAB_lanes_add(np, state[0], rounds[0])
+            else:
+                state = [UAB_lanes_add(np, x, y) for x, y in zip(state, rounds)]
+
+        # A digest below the target has its first word at most the first word of the target
+        for index in np.flatnonzero(first_word <= np.uint32(target_word)):
+            h = prefix_hash.copy()
+            h.update(b"%d" % (nonce + int(index)))
+            if h.digest() < target_bytes:
+                return nonce + int(index), tried + int(index) + 1
+
+        tried += len(nonces)
+        nonce = end
+
+    return None, tried
+
+
+def UAB_blockchain_mine(blk_chain, tx_list, target=MAX_TARGET, merkle_root=None):
+    new_block = UAB_build_block_template(blk_chain, tx_list, target, merkle_root)
+    header = new_block.block_header
+    prefix_hash = hashlib.sha256(UAB_header_prefix(header).encode('utf-8'))
+    header.nonce = UAB_search_nonce(prefix_hash, UAB_target_to_bytes(target), header.nonce)[0]
 
-    while integer_hash >= UAB_hexString_to_int(target):
-        header.nonce += 1
-        hash_to_calculate = header.serialize()
-        hash_to_calculate = UAB_btc_hash(hash_to_calculate)
-        integer_hash = UAB_hexString_to_int(hash_to_calculate)
+    blk_chain.add_block(new_block)
+    return blk_chain
+
+
+# Worker of UAB_blockchain_mine_parallel: search the nonces [start, stop) of the header whose serialization without
+# the nonce is prefix. Returns (nonce, tried, pid) with nonce None if no nonce of the batch is below the target.
+def UAB_mine_batch(task):
+    prefix, target, start, stop = task
+    prefix_hash = hashlib.sha256(prefix.encode('utf-8'))
+    nonce, tried = UAB_search_nonce(prefix_hash, UAB_target_to_bytes(target), start, stop)
+    return nonce, tried, os.getpid()
+
+
+# Same as UAB_blockchain_mine, but batches of MINING_BATCH_SIZE nonces are searched on a pool of num_workers processes
+# (one per core by default), with 2 * num_workers batches in flight. Batches are collected in nonce order, so the
+# first one with a valid nonce holds the smallest one, the one UAB_blockchain_mine would find, and the pool is
+# terminated right away. An exception raised by a worker is raised here.
+# If stats is a dict, the pid of the winning worker and the number of hashes tried are stored in it. The count covers
+# every batch completed when the pool is terminated, including the ones after the winning batch; nonces of batches
+# interrupted by the termination are not counted.
+def UAB_blockchain_mine_parallel(blk_chain, tx_list, target=MAX_TARGET, num_workers=None, stats=None,
+                                 merkle_root=None):
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    new_block = UAB_build_block_template(blk_chain, tx_list, target, merkle_root)
+    header = new_block.block_header
+    prefix = UAB_header_prefix(header)
+
+    batch_starts = itertools.count(0, MINING_BATCH_SIZE)
+    pending = collections.deque()
+    nonce = None
+    total_hashes = 0
+    with multiprocessing.Pool(num_workers) as pool:
+        while nonce is None:
+            while len(pending) < 2 * num_workers:
+                start = next(batch_starts)
+                pending.append(pool.apply_async(UAB_mine_batch, ((prefix, target, start, start + MINING_BATCH_SIZE),)))
+            nonce, tried, winner = pending.popleft().get()
+            total_hashes += tried
+        total_hashes += sum(result.get()[1] for result in pending if result.ready() and result.successful())
+    header.nonce = nonce
+
+    if stats is not None:
+        stats["winner"] = winner
+        stats["hashes"] = total_hashes
 
     blk_chain.add_block(new_block)
     return blk_chain
+
+
+# Blocks a validation worker checks per task
+VALIDATION_CHUNK_SIZE = 1024
+
+
+# Check the blocks at heights [start, stop): their link to the previous block, their merkle root over txs and their
+# proof of work against header.target. blocks[0] must be the block at height offset and previous_hash the hash of
+# the block at height start - 1 (None for the genesis block). If get_block_hash is given, it returns the hash the
+# chain has recorded for a height (the store index) and every block must also hash to it, since the previous_hash of
+# a later chunk is taken from that record.
+# Returns (height, reason) for the first invalid block, or None if all of them are valid.
+def UAB_validate_block_range(blocks, start, stop, previous_hash, offset=0, get_block_hash=None):
+    for height in range(start, stop):
+        block = blocks[height - offset]
+        header = block.block_header
+        block_hash = block.get_hash()
+
+        if get_block_hash is not None and block_hash != get_block_hash(height):
+            return height, "block_hash"
+        if header.previous_block_hash != previous_hash:
+            return height, "previous_block_hash"
+        if header.merkle_root != UAB_compute_merkle_root(block.txs):
+            return height, "merkle_root"
+        try:
+            if header.target is None or UAB_hexString_to_int(block_hash) >= UAB_hexString_to_int(header.target):
+                return height, "target"
+        except ValueError:
+            return height, "target"
+
+        previous_hash = block_hash
+
+    return None
+
+
+# Worker of UAB_validate_blockchain. The blocks are either read from the block store at source (a path) or given as
+# the list source, which holds the blocks [start, stop)
+def UAB_validate_chunk(task):
+    source, start, stop, previous_hash = task
+    if not isinstance(source, str):
+        return UAB_validate_block_range(source, start, stop, previous_hash, offset=start)
+
+    with block_store_struct(source, read_only=True) as store:
+        return UAB_validate_block_range(store.get_blocks(), start, stop, previous_hash,
+                                        get_block_hash=store.get_block_hash)
+
+
+# Re-verify every block of blk_chain from height checkpoint on (blocks below it are trusted), spreading chunks of
+# blocks across num_workers processes. block_store_struct chains are read by the workers themselves, and the hash of
+# the block before each chunk is taken from the store index instead of decoding that block; every block is checked
+# against its index hash, so the result does not depend on chunk_size.
+# Returns (height, reason) for the first invalid block, or None if the chain is valid.
+def UAB_validate_blockchain(blk_chain, checkpoint=0, num_workers=None, chunk_size=VALIDATION_CHUNK_SIZE):
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    blocks = blk_chain.get_blocks()
+    path = getattr(blk_chain, "path", None)
+    get_block_hash = getattr(blk_chain, "get_block_hash", lambda height: blocks[height].get_hash())
+
+    def tasks():
+        for start in range(checkpoint, len(blocks), chunk_size):
+            stop = min(start + chunk_size, len(blocks))
+            previous_hash = get_block_hash(start - 1) if start > 0 else None
+            yield (path if path is not None else blocks[start:stop]), start, stop, previous_hash
+
+    if num_workers == 1:
+        for result in map(UAB_validate_chunk, tasks()):
+            if result is not None:
+                return result
+        return None
+
+    with multiprocessing.Pool(num_workers) as pool:
+        for result in pool.imap(UAB_validate_chunk, tasks()):
+            if result is not None:
+                return result
+    return None
+
+
 def UAB_compute_merkle_root(tx_list):
     n = len(tx_list)
     if n == 0:
@@ -224,13 +1152,7 @@ def UAB_compute_merkle_root(tx_list):
     elif n == 1:
         return tx_list[0].transaction_hash
 
-    elif n & (n - 1) != 0:
-        n = len(tx_list)
-        while n & (n - 1) != 0:
-            tx_list.append(tx_list[n - 1])
-            n = len(tx_list)
-
-    return UAB_create_tree(tx_list).transaction_hash
+    return merkle_tree_struct(tx_list).get_root()
 
 def test_case_1a(name, tx_list, exp_merkle):
     merkle = UAB_compute_merkle_root(tx_list)
@@ -365,4 +1287,253 @@ def third_case():
         blk_chain_5 = test_case_2("2.5", blk_chain_4, [tx6, tx7, tx8, tx9], "00" + "F" * 62, exp_result)
 
     except Exception as e:
-        print("Test", "2X" + ":", False)
\ No newline at end of file
+        print("Test", "2X" + ":", False)
+
+
+def test_case_3a(name, tx_list, target):
+    block = UAB_build_block_template(blockchain_struct(), tx_list, target)
+    header = block.block_header
+    prefix_hash = hashlib.sha256(UAB_header_prefix(header).encode('utf-8'))
+    nonce, tried = UAB_search_nonce(prefix_hash, UAB_target_to_bytes(target))
+
+    # Same nonce as hashing the whole header for every candidate
+    header.nonce = 0
+    while UAB_hexString_to_int(block.get_hash()) >= UAB_hexString_to_int(target):
+        header.nonce += 1
+    t1 = nonce == header.nonce and tried == nonce + 1
+
+    # With a stop the range can run out, and a step skips the other nonces
+    t2 = UAB_search_nonce(prefix_hash, UAB_target_to_bytes(target), 0, nonce) == (None, nonce)
+    t3 = UAB_search_nonce(prefix_hash, UAB_target_to_bytes(target), nonce, None, 7)[0] == nonce
+    print("Test", name + ":", t1 & t2 & t3)
+
+def test_case_3b(name, tx_list):
+    tree = merkle_tree_struct(tx_list)
+    merkle_root = UAB_compute_merkle_root(tx_list)
+    t1 = tree.get_size() == len(tx_list) and tree.get_root() == merkle_root
+
+    # Every leaf's path proves it against the root, and only that leaf
+    t2 = all(UAB_validate_inclusion_simplified(tx, merkle_root, UAB_compute_merkle_path(tx_list, i))
+             for i, tx in enumerate(tx_list))
+    others = tx_list[1:] + tx_list[:1]
+    t3 = all(not UAB_validate_inclusion_simplified(others[i], merkle_root, tree.get_merkle_path(i))
+             for i in range(len(tx_list)) if others[i] != tx_list[i])
+    t4 = tree.get_merkle_path(len(tx_list)) is None and tree.get_merkle_path(-1) is None
+
+    # Same root as the pointer tree when no padding is needed
+    t5 = len(tx_list) & (len(tx_list) - 1) != 0 or len(tx_list) < 2 or \
+         UAB_create_tree(tx_list).transaction_hash == merkle_root
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5)
+
+def test_case_3c(name, tx_list):
+    mempool = mempool_struct()
+    t1 = mempool.get_merkle_root() == UAB_compute_merkle_root([])
+
+    # After every insert and remove the maintained root matches a full recomputation
+    t2 = True
+    for tx in tx_list:
+        t2 = t2 and mempool.add_transaction(tx)
+        t2 = t2 and mempool.get_merkle_root() == UAB_compute_merkle_root(mempool.get_transactions())
+    t3 = not mempool.add_transaction(tx_list[0]) and len(mempool) == len(tx_list)
+
+    for tx in tx_list[::3] + tx_list[1::3]:
+        t2 = t2 and mempool.remove_transaction(tx.transaction_hash) is tx and tx.transaction_hash not in mempool
+        t2 = t2 and mempool.get_merkle_root() == UAB_compute_merkle_root(mempool.get_transactions())
+    t4 = mempool.remove_transaction(tx_list[0].transaction_hash) is None
+
+    blk_chain = mempool.mine_block(blockchain_struct())
+    block = blk_chain.get_blocks()[-1]
+    t5 = block.txs == mempool.get_transactions()
+    t5 = t5 and block.block_header.merkle_root == UAB_compute_merkle_root(block.txs)
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5)
+
+def test_case_3d(name, tx_list):
+    merkle_root = UAB_compute_merkle_root(tx_list)
+    proofs = [(tx, UAB_compute_merkle_path(tx_list, i)) for i, tx in enumerate(tx_list)]
+    t1 = UAB_validate_inclusion_batch(merkle_root, proofs) == [True] * len(tx_list)
+
+    # A wrong transaction or sibling fails without affecting the other proofs of the batch
+    bad_proofs = list(proofs)
+    bad_proofs[0] = (tx10, proofs[0][1])
+    bad_proofs[-1] = (proofs[-1][0], [(side, tx1.transaction_hash) for side, sibling in proofs[-1][1]])
+    expected = [UAB_validate_inclusion_simplified(tx, merkle_root, merkle_path) for tx, merkle_path in bad_proofs]
+    t2 = UAB_validate_inclusion_batch(merkle_root, bad_proofs) == expected
+    t3 = expected == [False] + [True] * (len(tx_list) - 2) + [False]
+    t4 = UAB_validate_inclusion_batch(merkle_root, []) == []
+    print("Test", name + ":", t1 & t2 & t3 & t4)
+
+def test_case_3e(name, num_blocks):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "chain")
+        with block_store_struct(path) as store:
+            UAB_blockchain_mine(store, [tx1], MAX_TARGET)
+            # Opened before the hash table grows, the reader must keep finding the first block
+            with block_store_struct(path, read_only=True) as reader:
+                for i in range(num_blocks - 1):
+                    UAB_blockchain_mine(store, [tx1], MAX_TARGET)
+                first_hash = store.get_block(0).get_hash()
+                t1 = len(reader) == 1 and reader.get_height(first_hash) == 0
+            hashes = [block.get_hash() for block in store.get_blocks()]
+
+        with block_store_struct(path, read_only=True) as store:
+            t2 = len(store) == num_blocks
+            t3 = all(store.get_height(block_hash) == height for height, block_hash in enumerate(hashes))
+            t4 = all(store.get_block(height).block_header.previous_block_hash == hashes[height - 1]
+                     for height in range(1, num_blocks))
+            t5 = store.get_block_by_hash("00" * 32) is None
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5)
+
+def test_case_3f(name, tx_list, target, start, batch_size):
+    try:
+        import numpy
+    except ImportError:
+        print("Test", name + ":", "skipped, NumPy is not installed")
+        return
+
+    header = UAB_build_block_template(blockchain_struct(), tx_list, target).block_header
+    prefix = UAB_header_prefix(header)
+    prefix_hash = hashlib.sha256(prefix.encode('utf-8'))
+    target_bytes = UAB_target_to_bytes(target)
+
+    # Same nonce and count as the scalar search, also when a batch crosses a change in the number of digits
+    expected = UAB_search_nonce(prefix_hash, target_bytes, start)
+    t1 = UAB_search_nonce_vectorized(prefix, target_bytes, start, None, batch_size) == expected
+    t2 = UAB_search_nonce_vectorized(prefix, target_bytes, start, expected[0], batch_size)
+    t2 = t2 == (None, expected[0] - start)
+
+    # A target with the first digest word of nonce start + 10 and zeros after it: that nonce passes the first word
+    # comparison but is above the target, so the hashlib check has to skip it
+    h = prefix_hash.copy()
+    h.update(b"%d" % (start + 10))
+    tight_target = h.digest()[:4] + bytes(28)
+    t3 = UAB_search_nonce_vectorized(prefix, tight_target, start, start + 3000, batch_size) == \
+        UAB_search_nonce(prefix_hash, tight_target, start, start + 3000)
+
+    # Prefixes whose nonce digits or padding spill into a second block
+    t4 = True
+    for length in [118, 121, 126, 127]:
+        other_prefix = "a" * length
+        other_hash = hashlib.sha256(other_prefix.encode('utf-8'))
+        t4 &= UAB_search_nonce_vectorized(other_prefix, bytes([8]) + bytes(31), start, start + 500, batch_size) == \
+            UAB_search_nonce(other_hash, bytes([8]) + bytes(31), start, start + 500)
+    print("Test", name + ":", t1 & t2 & t3 & t4)
+
+def test_case_3g(name, block):
+    decoded = UAB_decode_block(block.serialize_binary())
+    t1 = decoded.get_hash() == block.get_hash() and decoded.block_header.serialize() == block.block_header.serialize()
+    t2 = decoded.get_hash(binary=True) == block.get_hash(binary=True)
+
+    # Fields that would not decode to the same string are rejected instead of changing the hash
+    t3 = True
+    for field, value in [("target", block.block_header.target.lower()), ("target", "0x1"),
+                         ("merkle_root", block.block_header.merkle_root.upper()),
+                         ("time", datetime.now(timezone.utc))]:
+        original = getattr(block.block_header, field)
+        setattr(block.block_header, field, value)
+        try:
+            block.serialize_binary()
+            t3 = False
+        except ValueError:
+            pass
+        setattr(block.block_header, field, original)
+
+    # Same for transaction hashes that are short or upper case, on their own and inside the block
+    t4 = True
+    original = block.txs
+    for transaction_hash in ["abcd", "AB" * 32]:
+        block.txs = original + [transaction_struct(transaction_hash)]
+        for serialize in [block.txs[-1].serialize_binary, block.serialize_binary]:
+            try:
+                serialize()
+                t4 = False
+            except ValueError:
+                pass
+    block.txs = original
+    print("Test", name + ":", t1 & t2 & t3 & t4)
+
+def test_case_3h(name, tx_list, target, num_workers):
+    stats = {}
+    blk_chain = UAB_blockchain_mine_parallel(blockchain_struct(), tx_list, target, num_workers, stats)
+    header = blk_chain.get_blocks()[-1].block_header
+
+    # The nonce is the smallest one below the target, the one the serial search finds
+    prefix_hash = hashlib.sha256(UAB_header_prefix(header).encode('utf-8'))
+    t1 = header.nonce == UAB_search_nonce(prefix_hash, UAB_target_to_bytes(target))[0]
+    t2 = UAB_hexString_to_int(blk_chain.get_blocks()[-1].get_hash()) < UAB_hexString_to_int(target)
+    t3 = stats["hashes"] >= header.nonce + 1 and stats["winner"] is not None
+
+    # Besides the nonces up to the winning one, only batches that were still in flight can be counted
+    t4 = stats["hashes"] <= header.nonce + 1 + (2 * num_workers - 1) * MINING_BATCH_SIZE
+    print("Test", name + ":", t1 & t2 & t3 & t4)
+
+def test_case_3i(name, num_blocks, chunk_size, num_workers):
+    blk_chain = blockchain_struct()
+    for i in range(num_blocks):
+        UAB_blockchain_mine(blk_chain, [tx1, tx2], "0" + "F" * 63)
+    t1 = UAB_validate_blockchain(blk_chain, 0, num_workers, chunk_size) is None
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with block_store_struct(os.path.join(tmp_dir, "chain")) as store:
+            for block in blk_chain.get_blocks():
+                store.add_block(block)
+            t2 = all(store.get_block_hash(height) == block.get_hash()
+                     for height, block in enumerate(blk_chain.get_blocks()))
+            t3 = UAB_validate_blockchain(store, 1, num_workers, chunk_size) is None
+
+    # Each kind of failure is reported at the height of the broken block
+    blocks = blk_chain.get_blocks()
+    blocks[-1].block_header.target = None
+    t4 = UAB_validate_blockchain(blk_chain, 0, num_workers, chunk_size) == (num_blocks - 1, "target")
+    blocks[1].txs = [tx3]
+    t5 = UAB_validate_blockchain(blk_chain, 0, num_workers, chunk_size) == (1, "merkle_root")
+    blocks[0].block_header.nonce += 1
+    t6 = UAB_validate_blockchain(blk_chain, 1, num_workers, chunk_size) == (1, "previous_block_hash")
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5 & t6)
+
+def test_case_3j(name, num_blocks, tampered_height, num_workers):
+    blk_chain = blockchain_struct()
+    for i in range(num_blocks):
+        UAB_blockchain_mine(blk_chain, [tx1, tx2], MAX_TARGET)
+
+    # Change the time of a block in the .blk file, leaving its hash in the index: every chunk size must report it,
+    # whether the block starts, ends or is inside a chunk
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "chain")
+        with block_store_struct(path) as store:
+            for block in blk_chain.get_blocks():
+                store.add_block(block)
+            offset = store.get_entry(tampered_height)[0]
+        with open(path + ".blk", "r+b") as f:
+            f.seek(offset + struct.calcsize(">IB32s32s"))
+            time_bytes = f.read(8)
+            f.seek(-8, os.SEEK_CUR)
+            f.write(struct.pack(">q", struct.unpack(">q", time_bytes)[0] + 1))
+
+        with block_store_struct(path, read_only=True) as store:
+            results = [UAB_validate_blockchain(store, 0, num_workers, chunk_size)
+                       for chunk_size in range(1, num_blocks + 1)]
+    print("Test", name + ":", all(result == (tampered_height, "block_hash") for result in results))
+
+def fourth_case():
+    test_case_3e("3e.1", 10)
+    test_case_3e("3e.2", 2 * BLOCK_STORE_INITIAL_CAPACITY + 1)
+    blk_chain = UAB_blockchain_mine(blockchain_struct(), [], MAX_TARGET)
+    blk_chain = UAB_blockchain_mine(blk_chain, [tx1, tx2, tx3], "00" + "F" * 62)
+    test_case_3g("3g.1", blk_chain.get_blocks()[0])
+    test_case_3g("3g.2", blk_chain.get_blocks()[1])
+    test_case_3h("3h.1", [tx1, tx2, tx3], MAX_TARGET, 2)
+    test_case_3h("3h.2", [tx1, tx2, tx3], "000" + "F" * 61, 4)
+    test_case_3i("3i.1", 5, 2, 1)
+    test_case_3i("3i.2", 5, 2, 2)
+    test_case_3j("3j.1", 5, 1, 1)
+    test_case_3j("3j.2", 5, 4, 2)
+    test_case_3a("3a.1", [tx1, tx2, tx3], MAX_TARGET)
+    test_case_3a("3a.2", [tx1, tx2, tx3], "00" + "F" * 62)
+    all_txs = [tx1, tx2, tx3, tx4, tx5, tx6, tx7, tx8, tx9, tx10]
+    for n in [1, 2, 3, 5, 8, 10]:
+        test_case_3b("3b.%d" % n, all_txs[:n])
+    test_case_3c("3c.1", all_txs)
+    test_case_3d("3d.1", all_txs[:7])
+    test_case_3d("3d.2", all_txs[:8])
+    test_case_3f("3f.1", [tx1, tx2, tx3], "00" + "F" * 62, 0, 100)
+    test_case_3f("3f.2", [tx1, tx2, tx3], "000" + "F" * 61, 95, 64)
@@ -1,4 +1,4 @@
-from sage.all import *
+from utils.backend import *
 
 ## Definition of Test Cases ##
 TEST_CASE_1 = [(7903126559821964686463557340728820271223543529858019901688309838372108285307732092722360827326246211951376647434255034435564932384099820753498888781877615, 317972381367064990840510369007541461276421699796106904494686897344835795539271666892617538300755232236454457559774034880884430208166890487378588726592003, 7592548777848414075243152464261265522912583433632018101996423752018161580785582121152523027483451723740126100470276926899087407703025689336574991899612012), (152074104640245865992544923627127385070409636762268453615601640828536915249239636592446444995690082201486287476818186937523680842762470853746484001754610, 3284555144292363429064093827579288695922287488582305823291375087777601747108772322465274421396420144882333019128945395479107224598150323742537126430517439, 3159180499746066425254825676564286213733923755718231242727849286128673993619250228491278655423833167038161052374052212357729476839611145507131502028907853), (5988684292561848524790921639531339144574702278362547798697206947681910248908307527142826680666745274020791735971963366779862125467702681048924497312816590, 3521713949347709828296048327570931513851379393204131904435802850806724899745970487193946162375829096170740176250209901675251928675536265864750081016499632, 2587170363082959993601397208812113250116107831369749113435817987199082636970282382249684340256094561851854720507384379569179343348623070227841688270246014)]
@@ -17,7 +17,15 @@ TEST_CASES_FAIL_SIMPLE= [(744967814891074442963828085657156080182017120929898948
 TEST_CASES_BAD= [(304212199735718425513987963153370842576981483791022853506122084897617232680961446641145943588783187627748887098150899521401977283855303053786958006156870, 56157944529137268655768625577864577628449673518753467206780991927626506971775069113166872726868492948961041822800259274906061195494771205837593075897139930526920179428319047262222071033942775916357670909596893050891270758893269511972926338537566037475984806844732102655018803238407291845867346769267119985559944739646695093963583900910301912739922368655670975894111706609625448341049618968600696642899641885908479838160049691650927926378444476392553822529437735642186361552621550490565886537610498041436277261319837954869834413878122964366631066351802779958055054755382549276859118640163060031962318127695116963435906, [], [43666126423359818380299107289539747128738536969785888655112588544344070445080237638473344644805625962352840454531908130469781097458920877178092475991711673468858377732437664336055622262804235972112656394602331507369156291848317545084231641002779756646348796931777531819158550170274857047537475213786243751459741445629743222739618712812292584679013447004127763579836212668370543961658188375607768683534043138128456253062650498608435617833109503260351415718325281009715647231951765057758209559382684064032140476799626636484465051431967427217096612221890997281917700233541009906920187472906593815359552340168414573587827, 63310018548215154951753262085366489704926469197979055962810741589023818469565079827603734365754923864284185777713176773105372710496227290019561141774874191852375175105533469998029504849893342447518985242802079995088122136720058582874985911595374017113199060255986962097113279423160330889637113823549540590411118857129560292248431027623452211420036972531159260932060307180622475910155565054570636963664614459748040557922099034293584859672315011593754554719500086380511884307485451179954970966850983488451374197527674431241875462358226171696005832608672745585287478791223960386561421125925087877951122898425910769254125, 45831315220134719282322451308786544910389438862112028568141337578335515961471700697961221953657710740326075605594935396234298619991090117922186913706395695544726857895275390242206459198349245109081891127288030835957812351968607974737292371707262634582001266087246684661884533004714257874881396005561543687898684872185219297203816572165235002087342576115247679833076454906095402563715907156495861997710483997111035067395687389887655379132196797099138266509811474393468275347420215503875786869474241134726128554581325206553567614662910912799651913701506105738877348728691659669492527792470836815746115145039906723647630, None], [(23886717043623017856905477973250787179871536663090941133210085363705816721313635907300739148511337307535528348855556093231415361339189208774490910360656473080818431391131661802148736593752918669927913465249400970305332562849920944684763363605717386800704802652405511532213282620518506210701738791332605203954378018871366184513133060323565467367530314499023897162321578840937332724700159499951709154651616453566567668135584098478930096378727750433484195143022627106156802370774374882809539873379072084771964294211897505463230438074694657982885584648970300576313558790637275719863093018977047642005840391086066200592293, 65537), (108935754421006150321794883939476898914792477990350543474713340036780570937367550695550764627744624821173061278456131579236451088375699741732644183165767304701301251641091625691884964050177155744448266456781182142985502802083491893119256879377218522689224587781353300781747402452919865022273964256026308898221, 65537), (24453381766611862577685630932783739434927355058212609332774260261402449239451595706310993992772911312312732861341514385691694088278858420595775919108158959629138908610900908228684812493991700581357260820527403092630508574322470020752816106490387088386828445618645606537035168195033884920204970737351112227687413424450472034245530274145430175750955561695340041518953504414469636293659353268954671091419012787181490246124368012199684255509232956314826907523518781218437910213024426465992931829119860142054322811668331017943598696808477827255901813592648092801196026131094522986486478527108659865302542230752963023166973, 65537), (18787747671944956382818574826750151448134966320343258365645922270541191358297329894991231726700811222905310244971131081678975111157589957531867260456023868299050825490381504647015913562782193139202049032744078683491287728115795141442944240985369396368339811151418868479417685343827539170564981960981248205372224589612804201646261809025952562151156954180642492414164186778402461378860126159492739533050774540165401558662300222691467800425738354104659008924027300944682996547227882625756980181522114275322038004765344424762778748644259906608665534439812655239364883929585906582507875682203866356532457024524732598177901, 65537)], (18787747671944956382818574826750151448134966320343258365645922270541191358297329894991231726700811222905310244971131081678975111157589957531867260456023868299050825490381504647015913562782193139202049032744078683491287728115795141442944240985369396368339811151418868479417685343827539170564981960981248205372224589612804201646261809025952562151156954180642492414164186778402461378860126159492739533050774540165401558662300222691467800425738354104659008924027300944682996547227882625756980181522114275322038004765344424762778748644259906608665534439812655239364883929585906582507875682203866356532457024524732598177901, 5840407454118049291044186107776993689867611713144532137316391876615281315021918945796364862109581260116421038814667340998912979532379880140939190034187928480958274985360062166007830798092094859773308893359401788589163447898181094902377329166652893971530386996473085547571242252617581755678782634100904369868055378321874337792222202310627823498500013328964224350772423965058108556830352725389483079887403404567968979601352673557456152459776433400739665687584698761594969878390562841328708639436609168704431255280807507582306887099398199549814620941913160099833738207442551591111173226277818045161309096574516573291021), 0, ([(23886717043623017856905477973250787179871536663090941133210085363705816721313635907300739148511337307535528348855556093231415361339189208774490910360656473080818431391131661802148736593752918669927913465249400970305332562849920944684763363605717386800704802652405511532213282620518506210701738791332605203954378018871366184513133060323565467367530314499023897162321578840937332724700159499951709154651616453566567668135584098478930096378727750433484195143022627106156802370774374882809539873379072084771964294211897505463230438074694657982885584648970300576313558790637275719863093018977047642005840391086066200592293, 65537), (108935754421006150321794883939476898914792477990350543474713340036780570937367550695550764627744624821173061278456131579236451088375699741732644183165767304701301251641091625691884964050177155744448266456781182142985502802083491893119256879377218522689224587781353300781747402452919865022273964256026308898221, 65537), (24453381766611862577685630932783739434927355058212609332774260261402449239451595706310993992772911312312732861341514385691694088278858420595775919108158959629138908610900908228684812493991700581357260820527403092630508574322470020752816106490387088386828445618645606537035168195033884920204970737351112227687413424450472034245530274145430175750955561695340041518953504414469636293659353268954671091419012787181490246124368012199684255509232956314826907523518781218437910213024426465992931829119860142054322811668331017943598696808477827255901813592648092801196026131094522986486478527108659865302542230752963023166973, 65537), (18787747671944956382818574826750151448134966320343258365645922270541191358297329894991231726700811222905310244971131081678975111157589957531867260456023868299050825490381504647015913562782193139202049032744078683491287728115795141442944240985369396368339811151418868479417685343827539170564981960981248205372224589612804201646261809025952562151156954180642492414164186778402461378860126159492739533050774540165401558662300222691467800425738354104659008924027300944682996547227882625756980181522114275322038004765344424762778748644259906608665534439812655239364883929585906582507875682203866356532457024524732598177901, 65537)], 56157944529137268655768625577864577628449673518753467206780991927626506971775069113166872726868492948961041822800259274906061195494771205837593075897139930526920179428319047262222071033942775916357670909596893050891270758893269511972926338537566037475984806844732102655018803238407291845867346769267119985559944739646695093963583900910301912739922368655670975894111706609625448341049618968600696642899641885908479838160049691650927926378444476392553822529437735642186361552621550490565886537610498041436277261319837954869834413878122964366631066351802779958055054755382549276859118640163060031962318127695116963435906, [43666126423359818380299107289539747128738536969785888655112588544344070445080237638473344644805625962352840454531908130469781097458920877178092475991711673468858377732437664336055622262804235972112656394602331507369156291848317545084231641002779756646348796931777531819158550170274857047537475213786243751459741445629743222739618712812292584679013447004127763579836212668370543961658188375607768683534043138128456253062650498608435617833109503260351415718325281009715647231951765057758209559382684064032140476799626636484465051431967427217096612221890997281917700233541009906920187472906593815359552340168414573587826, 63310018548215154951753262085366489704926469197979055962810741589023818469565079827603734365754923864284185777713176773105372710496227290019561141774874191852375175105533469998029504849893342447518985242802079995088122136720058582874985911595374017113199060255986962097113279423160330889637113823549540590411118857129560292248431027623452211420036972531159260932060307180622475910155565054570636963664614459748040557922099034293584859672315011593754554719500086380511884307485451179954970966850983488451374197527674431241875462358226171696005832608672745585287478791223960386561421125925087877951122898425910769254125, 45831315220134719282322451308786544910389438862112028568141337578335515961471700697961221953657710740326075605594935396234298619991090117922186913706395695544726857895275390242206459198349245109081891127288030835957812351968607974737292371707262634582001266087246684661884533004714257874881396005561543687898684872185219297203816572165235002087342576115247679833076454906095402563715907156495861997710483997111035067395687389887655379132196797099138266509811474393468275347420215503875786869474241134726128554581325206553567614662910912799651913701506105738877348728691659669492527792470836815746115145039906723647630, 9133294678956341761087127255223383500255110515027344074875817757930955880012858520221941241073091809738932534831336564572208490807496758673385948129084212522206030680165360471826372232092817941365147666679301727246287386601661031683465998739764747265277530103726580502872850899269838183773902614883288055700964496214160432312905955433900228027567136073473827555142543229167072482880329715542736853651199625157257133990574843888747881748495416875982154520469885742424150214834212851914797016962987970861796430245397856145800789093459271193277008442240048981846884057732039128798776456492679148683752061224036475624509]), False), (7955101755030595255293479544444564440503491055078332630058241781245220158262734200341212656592325741418678483673767388595531306676246029080777602924644842, 62669343413330620828838362904305575437842468587020190206335488795025467341184883950191288267515166924987228822893078996060230202454400943068018236630467916470286458411796081108175463854663225391441303944030575151917371342883983224863782712603966825491146864289619527749974504785840294373717341824128668179180724454526927099419273352691504254333257980897672410583246699515645162812591726473979932685546434501654947706103789002535630944183219005094458938780541261524312777909363767453758305967765493087245012989506938934481914711607335617392269195257269927710683294417162959061900102835993789152514472230174872740246271, [], [None, 39237620462845490086199809382892145751790480938608349139559368223877077816162583289165791452582020739167747313693639064233760134991547124995959015869697815705108937510874263472850184835178521263354609401154730837176178457992222398294909285236532904987494050493098680945150071329027376001958856490409147778025767818046440491006800232415064289139925408491751172767264308544076823357388175672564933198211283177702847451309069265746853883784916872133809379499666273031462302899794792477499318003262358576322437260000678521934804706666230186247969237749553747908476393328737062059298886474964230447693352245414956662773078, 38279400015408849535372713916564956236290746457816289964557836841403569416953936952320523500324052201939428143127931902887321657662348200234331392701592197943784918563789540574258399069900887498499608155911632599486834496490075293827479492009430335517312839758755644274817192641158368775359477214857682899637649047284562456440724819816308488948407782570420070838019499805160034294629083876351873879634897078240376460126522394686445628584778200838288618336886162294917944103559964629083652457856759220994787764864923479694494345367399176854514662524165439287174087940180848839845473244845569333896280668526325849120512, 49166907764019369944648926494939212239821535261626684754009571031979368441891949406171439613041161702231827055622262122999208892241424726333081703101483865229155186836698717843868020511476018412962773130613636488492097697884786137755665920666378419028407741139828653565010748736607828259013671803169290371174234179405256367667371626775059515095659722302067914079681538821954423245842550263468207422153886772587479225452595430060704541196018650863106378641976012732113734026714928033790892376370620919412388595616262819382865010964467814791734240172177688119294182823361523882934229547378467527566634746952826231599932, 46248493716848738490871646050515070846435511092557618123475028889810563706612013847912759316650810451139127951754433022611662060919532384503454548477172342858891944523127672450534668606609094471339369879839459661423565727300418506211683166275764244099002512300248634810185588272039110665140109586790329541448187936736207364304615347715453668529572438611238314086002123883658620862387202361628633501300320262674563480603985581841919494005040437561944386704869767830979268597067690555245590909498399115905450810374926168411818540988187675902686431692905780868099067354764765302503946982001764820289657745959461284455897, 48235094432932158222657340788939489857873435867213505014543344089704399819042046853293592764486125629830634918956798852135993079647853653517681878348249704089487368230738656650051219058236964713330678421226719005565161256028291617313336479411764636275777413624600038869204872421486044641893532323601909232118219756198299216201949039116774952447583511284109606061102218520541585164100184728270473980133660134180280053692598432283607055872035258276907531621572808869125353516143289405856880744325773127649492534324703125269731466567491927629676472296763768903439277185183764563037452755928620415048136115739143477371937, 63464142726897452032639462812915453241827417622890728800959918322953466509455789001282700687746549235674118570453134598918245295599875742382187428378966845207632934082037811929180385530507465625049771777550754381965166127674599964594699780325035179280478069904984853774361177080947232867422780086994831317731480642626116008318881099901925986706498464875082584969199163710790787096888764224198439746711554785709139275168159845761166898357828972972795893375106160590332660246695248094013082849236272293186152680806206000269591859447932969797698649619460574589003326285459805062861168021333640731572136958782732156897359], [(23680421547046292089094485210096357326418189116828847836918518937552367080881198212153627966318815569255492713093264021038181264480744767423735193910937974229746829873720532579150599458945606842361504453024220288345278335497331693905972818167235320916288279172526855625547800416834322301865741978644791717137153116760124156841889419714281984270938966637827364571991879750243844033141215280836423244109688465151590773756490794127268366329698547918081279317525676540797554747382169049313923864214377064853575699996999384161562060488849078181925029540227915962780488321178299395366141300095829670334513050024737230768253, 65537), (116174906182524875777102473875153831917269577194591860467386345611038588417827657823317001899815442336076400584975149879126837567364496548814390327908975528387863388159238508124068478096270085847772989357570343518978203414491272637726542306246487055805596089790065025199351894703867722245473067249123266689471, 65537), (116334805386390616861930003961583677496059387054341863771968934875666484155755530017234738240030957873121007552375471713588825834949053676589087677062105649771192692935471313255769744705087257285697454171923327145909617538941379001743088218882265179003306224627361061352710700568421570069850942385467817105513, 65537), (109050619476178600575086775217587510262497078484279326605290166908837932674782755515632255160003423948423074088854899107869881938949319461761235292107533172270846713946751079442314491934760963268241070006183368358178122680163742822045035058004042420151034683564645033410111001149191993656590683268865399033001, 65537), (117638854319357951481885124681513704218870049093673521639716214268688439848553116977028080246552140193716371600563100767422946686870170874431759199742185176336727988087693897810118852517782505123429595176531280515928917745492572009519187894450409996692488818626917216183110158138216120894218183454830068828239, 65537), (20965636186639852810125646307885230299747243352872845048069074018688550408689341200378483516339827934873422479846892260753886358019282156587385307591852969047207822351738101765347111317631771709891801964261073107944120691547976326785062866589817012319122106562071771083659707641200428226278536848244350264315013299281628515902455462071506686499348703835345423301341189848065740844046720034208621758938217957765387074506083770537685970388596382885290906165344501978709714874594422351469275069658163333555458597551294208209099294585440328290160358796015289962169803752084223596692886242042070311234509431285505421968269, 65537), (167995512921600776717595248415329842480519763109018057326931679806959936211134527989709440374406643276695346399148372566341043543318775365701483887278380645705644918754990449651622484680261990546616968001054101660878754288328780213344403404031017433511354551985009231744793696941298273990393490789085014302199, 65537)], (23680421547046292089094485210096357326418189116828847836918518937552367080881198212153627966318815569255492713093264021038181264480744767423735193910937974229746829873720532579150599458945606842361504453024220288345278335497331693905972818167235320916288279172526855625547800416834322301865741978644791717137153116760124156841889419714281984270938966637827364571991879750243844033141215280836423244109688465151590773756490794127268366329698547918081279317525676540797554747382169049313923864214377064853575699996999384161562060488849078181925029540227915962780488321178299395366141300095829670334513050024737230768253, 18623621578312403479806948085795603236618189777676617410172182173113265851088373258629816632436705861888194537715382366790514346611327140432948706296558662553208280900122124756924793587026785905198539184243623634006627339795893467313146024291249872753823496423552789914887540306765256879057083373717287252768164957755367862201507430592634567962608867663603822226859025391438356326918354340095490193076534459393669947286208535058363474694988183836756070440211215097714712543349695600259188382783206173881836246264651405540123611146140398130899671789857083324644003097503511417307118413057040012330770771963435247148673), 0, ([(23680421547046292089094485210096357326418189116828847836918518937552367080881198212153627966318815569255492713093264021038181264480744767423735193910937974229746829873720532579150599458945606842361504453024220288345278335497331693905972818167235320916288279172526855625547800416834322301865741978644791717137153116760124156841889419714281984270938966637827364571991879750243844033141215280836423244109688465151590773756490794127268366329698547918081279317525676540797554747382169049313923864214377064853575699996999384161562060488849078181925029540227915962780488321178299395366141300095829670334513050024737230768253, 65537), (116174906182524875777102473875153831917269577194591860467386345611038588417827657823317001899815442336076400584975149879126837567364496548814390327908975528387863388159238508124068478096270085847772989357570343518978203414491272637726542306246487055805596089790065025199351894703867722245473067249123266689471, 65537), (116334805386390616861930003961583677496059387054341863771968934875666484155755530017234738240030957873121007552375471713588825834949053676589087677062105649771192692935471313255769744705087257285697454171923327145909617538941379001743088218882265179003306224627361061352710700568421570069850942385467817105513, 65537), (109050619476178600575086775217587510262497078484279326605290166908837932674782755515632255160003423948423074088854899107869881938949319461761235292107533172270846713946751079442314491934760963268241070006183368358178122680163742822045035058004042420151034683564645033410111001149191993656590683268865399033001, 65537), (117638854319357951481885124681513704218870049093673521639716214268688439848553116977028080246552140193716371600563100767422946686870170874431759199742185176336727988087693897810118852517782505123429595176531280515928917745492572009519187894450409996692488818626917216183110158138216120894218183454830068828239, 65537), (20965636186639852810125646307885230299747243352872845048069074018688550408689341200378483516339827934873422479846892260753886358019282156587385307591852969047207822351738101765347111317631771709891801964261073107944120691547976326785062866589817012319122106562071771083659707641200428226278536848244350264315013299281628515902455462071506686499348703835345423301341189848065740844046720034208621758938217957765387074506083770537685970388596382885290906165344501978709714874594422351469275069658163333555458597551294208209099294585440328290160358796015289962169803752084223596692886242042070311234509431285505421968269, 65537), (167995512921600776717595248415329842480519763109018057326931679806959936211134527989709440374406643276695346399148372566341043543318775365701483887278380645705644918754990449651622484680261990546616968001054101660878754288328780213344403404031017433511354551985009231744793696941298273990393490789085014302199, 65537)], 62669343413330620828838362904305575437842468587020190206335488795025467341184883950191288267515166924987228822893078996060230202454400943068018236630467916470286458411796081108175463854663225391441303944030575151917371342883983224863782712603966825491146864289619527749974504785840294373717341824128668179180724454526927099419273352691504254333257980897672410583246699515645162812591726473979932685546434501654947706103789002535630944183219005094458938780541261524312777909363767453758305967765493087245012989506938934481914711607335617392269195257269927710683294417162959061900102835993789152514472230174872740246271, [3147422728192416636161551805249817592839841225502194117185225000662324719850402947052643768391198127318699078618666320054017095752372013945743560516602254440108009348699206243874369165190048049295248108589515768341581804023331901898451340215707551634380851001049583242349868437288396931686184692159564855316530159362631338887970674141949180198114453058057394227777432416849921792049771631303625349645697892940764464091042743149093807491586007185804018099352097970416939531593796767722850440734855362476501908762717541983418002300182838374755109240702149963276423607702344362666558719812083072503740369708076270888958, 39237620462845490086199809382892145751790480938608349139559368223877077816162583289165791452582020739167747313693639064233760134991547124995959015869697815705108937510874263472850184835178521263354609401154730837176178457992222398294909285236532904987494050493098680945150071329027376001958856490409147778025767818046440491006800232415064289139925408491751172767264308544076823357388175672564933198211283177702847451309069265746853883784916872133809379499666273031462302899794792477499318003262358576322437260000678521934804706666230186247969237749553747908476393328737062059298886474964230447693352245414956662773078, 38279400015408849535372713916564956236290746457816289964557836841403569416953936952320523500324052201939428143127931902887321657662348200234331392701592197943784918563789540574258399069900887498499608155911632599486834496490075293827479492009430335517312839758755644274817192641158368775359477214857682899637649047284562456440724819816308488948407782570420070838019499805160034294629083876351873879634897078240376460126522394686445628584778200838288618336886162294917944103559964629083652457856759220994787764864923479694494345367399176854514662524165439287174087940180848839845473244845569333896280668526325849120512, 49166907764019369944648926494939212239821535261626684754009571031979368441891949406171439613041161702231827055622262122999208892241424726333081703101483865229155186836698717843868020511476018412962773130613636488492097697884786137755665920666378419028407741139828653565010748736607828259013671803169290371174234179405256367667371626775059515095659722302067914079681538821954423245842550263468207422153886772587479225452595430060704541196018650863106378641976012732113734026714928033790892376370620919412388595616262819382865010964467814791734240172177688119294182823361523882934229547378467527566634746952826231599932, 46248493716848738490871646050515070846435511092557618123475028889810563706612013847912759316650810451139127951754433022611662060919532384503454548477172342858891944523127672450534668606609094471339369879839459661423565727300418506211683166275764244099002512300248634810185588272039110665140109586790329541448187936736207364304615347715453668529572438611238314086002123883658620862387202361628633501300320262674563480603985581841919494005040437561944386704869767830979268597067690555245590909498399115905450810374926168411818540988187675902686431692905780868099067354764765302503946982001764820289657745959461284455897, 48235094432932158222657340788939489857873435867213505014543344089704399819042046853293592764486125629830634918956798852135993079647853653517681878348249704089487368230738656650051219058236964713330678421226719005565161256028291617313336479411764636275777413624600038869204872421486044641893532323601909232118219756198299216201949039116774952447583511284109606061102218520541585164100184728270473980133660134180280053692598432283607055872035258276907531621572808869125353516143289405856880744325773127649492534324703125269731466567491927629676472296763768903439277185183764563037452755928620415048136115739143477371937, 63464142726897452032639462812915453241827417622890728800959918322953466509455789001282700687746549235674118570453134598918245295599875742382187428378966845207632934082037811929180385530507465625049771777550754381965166127674599964594699780325035179280478069904984853774361177080947232867422780086994831317731480642626116008318881099901925986706498464875082584969199163710790787096888764224198439746711554785709139275168159845761166898357828972972795893375106160590332660246695248094013082849236272293186152680806206000269591859447932969797698649619460574589003326285459805062861168021333640731572136958782732156897359]), False)]
 TEST_CASE_1a_f = [(2975615421427825323368931824713546714861249292219330158425011842305282681632546017232423586267746819025954051972004876058824740862475738574975761006514012,2117483007157468898956781333525175776744703037227097669597540573815968403770525509432471058715533534831008052132642980457901324636077583723331444123014101586672926064846651045382755259913824226442937231653262831652991905648763826058833944666793128027133831053598077015090224770767136826032103912580237747923,113733219920840627699164522542198698167341294591519437212741988733378326412710501553074051994295796698991756355102054099387634841694809401291604578737857015480675574376558543262193202396845391600673377242693735032983736802636566227732293429349040926681267696544432695498992354826192731454621666247694671175493,55652132878805097891251452381820630373653769045884347062334157655678374480596556211713314772410928103810659479756732574448736990270433833919415835146355468300917810554569014338265237675475222883186823856689084823883817017501315240313948554605475633783703124802879551010205189673593579964445853199538227288670),(11682791783353743903985319906907398343120171698910846407160043590546273567231718444750870777782128596321924230373090715949847129167892465406980630607599348,19895947661102428462596261407178370155247906631085545039027720802423168351453521084110924740835534240526548857929278848321256674032999457484366161515301033987869809854174753890697084614653892424806611492430394832552781811480695856066919474312646431217245541095942864670301605010681236336445905464750995632309,141060984659659210358786684631882966160378138929153658204474386595695126491927021523498360110360795592087025260767135828036875552208793636560481604763075700580115104793337730000190552836257975571933258657226272469210415222469752530144771198571586922718015161556036367299111494957412364271572092224275865420857,39562162321348387944338512327331480199469666905317094091289197273010734948491812238708597689360410572593264551219721731871232326431533820599732551044873164317126675262106981236566502131233428808861334275120149393542043384608903532631059789148342750858392820605319543519168376867371911338034877249358381240908),(5756156040396885868103230440692136794211321624425741973445025241156475065759993878761723676115690626692565158799494011255935525534199497869517134381626955,957483334457907178682101010738290147680044749615977870858910914583713620976047369648376887342201574153007061478281284331857899592542048190049171139217152419379114800950159231845126077350202746597637116167283843469109916433284410379876544999263598793920066647186149527461277187829422407382251911264009226993,112911534485592195716219260352236295831771646883638941470949967807598451782109251398372786443087475601017766600273721153858697553929695388630233970221996455160219285438711355368858483728937581635055706489395585401014023985114119486571325156581767298475285274334513311300928248686491740418883144773205184048849,77579391394872382900664436350173385107933474116148128056090123184855928227975599628695556612124796367574706529770507399709984204462778053242093948430985430379741166345426477430806146152108497108925451851184101659833814030956954249009970939602090467861888488202787916853092364987777513890221679236768925617357),(11221487551939142493336714718308934272677063814901986081328872836816622417633379455330472319954160135964512110662567589250707780416241963203142778850082154,21013871521626205965007542807565796330198990277556826702764717655788552758309805304378846936030689502478250562006646129350094808919092751869203152880290441677880887690637917424006855231661234045481242916893006504917035731419542334366348017885991879481261555812801315880778604504198977260478806401609023441745,158452062119636042147926057985323545313496085350082465813621503883957243527739712389469768353752896269219019396218094388680568773184212354513256288363987216844772700927915887932214160782249718779758967391815970698776314169408356565342589589072514870194018977973713697439443132634410351162144055807399996686909,89864366488582285806064295230717925088525421835688709970280951126664809258711690609040882912347830337973245030718726408494609665044105218996674278413821389748892374699068208643569027993244611676591063364119223794912005119314134083530484686208298010372672181915165187599825601697763866239036783081197443312318),(7055478545776841687250935939081956291382931775313540821459669225782865900626749863231423328731052195864722549212437080283505691048028652899730432147212857,11345141788491318087565186608714693579691440785377773646563540540298651353931342968544099410247917600788430334046709560842833200699395957856901066935130168554913074710370257141260567646205529219845707261373194252612601203843999344110210570297914099215440786449114485830852773030527966132542236689448838778305,176546730949152442954947081746488156982604287012062958916023924110068316225240038971738013308659094337616373929103455891952216425082823908362275964318562499941061326723340050873846479056712683315908995873459199903487592249170828281863395913809090207520155698114494214810771933101687809816019784421562344465077,115671928418168067846145994650741449624242115774679268709566205895171865556989740130168767075743185485637651825988766625069028149315468112834740921943788070033840910986640567841765020775255747680597475174598143881492794293041833362727142488571865154354133612603386051643410647634279771860185085690822646776884),(11612034289783034933234009715188759485767353478749812722461647937756079096269874560114197448382343358488006102313755882582942540203583568966796390763944738,23226508231061749958244391799828185022681237710476466287937630471547265389066617103059032355251897721069794285645325616474127872469200488343113299126276430924836820528710898619240916051699246082709242691877101936122630025968547188909892315241397907521481477245471464394027322544455592311309427270364399579229,142835288537026734260435648436270973241199237668339698893925916131537311795370074606660392555704571731796106605830693903243400429578116956417623748225464831425961613342653165049382256689871394794642359086477770899178630507474344547277143756305516735162985788152221140938659265487361569454890357445921034115869,3061109746582605582691336829687816286568782285011304933296589054040610235375769361804171192081324051053893014935437796274131594953551897790685838463273582966233580670642677612068992316582853772264021746056800794638583023686822231508730297801037558120002232933064740168696029348666470330346842771320729927449),(10798711520575534161624771786155670597458813796001078613194014463431417032526528482126913901758259102663494564829016122611213881543220041333946029075787204,474060596289876794110689593873312844312335986485557604721208726987628032655148989056656709015831211963404253703181844185297407251104159409199329925274171227031605367158465353055071793707930764248454359536845847817922374192106689247518933301745715040285034804816853206610278366859960810031919016227508631357,109076100523287263156110932406115753812864471198258591248498032793170901261979517714942460171224798613618342568562066199081929241716606068580561095304950376836632904497181678990846337685119500837178906030673189927184830102791465981142208540924771437726584920899952597861068175380692492077881204048506580216511,13356186271046247153799714565788409919724364420779933274329089943248841627797426783330862474941434698449390888571325741174173708316989823595443038974977759819859126794268844812278495125886148669909312041950743859572455502279493020332756870264356942310230610221696418254651244305287985684217100841343318508422),(1871044762640861744947597096578793888717016567724554574714617615905148175094893027392981975295722477777388154950103670391744625204501260982735705456431889,29735327061062791304664616287846173434545466396768985479910699287512465108480429559278831936225255642282972873217252626200124478476032193364485327565305273899481617950845584865704281198484298918609271274112016249032798061060209021436368103396453888390704973197445004348853853437644708916100532291007882623705,125714552114367780778234684234207958480134582540079927839041866864864976022609548238974086933806056125426519575011391501679034799592537616135746535022250239387686600179504861953958910734198128197901236737696438781982012167606242763748711273677872806919031386949180376514825351048173970810811458904171450359897,36910210371012784299859732721065835905502910641168217796400279742915088740224987872130479106194454872551117577251837831659758788322552065710372516183930877904828456910674303086856489489160754053312346932273225342792181568166310480829808763616970427748950397918005591807831152773701902168873082174335976563932),(1512530677221438750915435768660579196907857546320305853133040567738515518502081501621822152259466713658483079923569696005628892250276716460499506436623740,18687782482631832618897248592128249785965441901240056887362424743360350877731811131186157734092176026491502351612526564600100029541377316529291953353517089909747583170678011579899122743029948917917730100931886757515084618249776828312439734658840772178924214877031661217167387583464673398315178596558563517793,122891952695589244867014748242254576181298130230942164180922258720209443655820761198529723000120303055205056152682134604073525550476946136201104429754108944917851102526582976621660276529215407931589734265669129347040938301910748445913852193376401234978111037593082870695960552546099836815300172567243173695369,115026829189701676420289162433548314650088739626233628495709922492713885455547386864223813343516758971176435406690301268434068737778525396080818122458737247766460700614653986387714662312973422530861910424342709469181499617325994908769446489934152740067245954691036665291965319343100619823177326893694502930363),(9036043172129548956081950212242002929212091951570491013790752998764787192501632832359255802827501693587732034265128496655564878652938414775808021619819268,5911899128676693971222535272625534927697900523524951169751662676281939415175692267207596166963776320566666266268858165870282099607556082839246933036661956912610382340003091871389326381655400028382750472139547783400863187664196238858723970653187178211245521690188766441599361791286185395557109274773551808419,111995413555740567362916980535354728300776790464013506232696839663387617705555526554699878593526523694458045119948593038485526221124556439091119020212086932637243494786148292529991485153906075100961776209276248644365825121798062243428745863350546094642507470844264518503998703843831686445491111517923608122877,98667974496480911270270059619793233040100087401374648993478055183170553045396496260127338340456022762239734637455828474978956180332764879030467305458982435546892838352485169291624067654710071071656719914932489441330523709604945031779279224427410591977446100888884906757973929485437279515923107501610814821543)]
 
+import atexit
+import collections
 import hashlib
+import io
+import itertools
+import multiprocessing
+import os
+import struct
+import tempfile
 
 from Crypto.PublicKey import RSA
 #from Crypto.Signature.pkcs1_15 import PKCS115_SigScheme
@@ -25,24 +33,30 @@ from Crypto.Hash import SHA256
 from Crypto.Hash import SHA512
 import binascii
 
+from utils.cache import UAB_load_json_cache, UAB_save_json_cache
+from utils.ring_core import UAB_ring_combine, UAB_ring_solve, UAB_xor, ring_cipher
+
+RSA_CRT_PRIVATE_KEY_LENGTH = 8
+RING_DOMAIN_SLACK_BITS = 160
+
 def UAB_h(m):
     return int(hashlib.sha256(('%s' % m).encode('utf-8')).hexdigest(), 16)
 
-def UAB_xor(a, b):
-    return eval("%s^%s" % (a, b))
-
 #Returns a tuple with the (n, e) values of a new public key
 def UAB_generate_RSA_public_key(nBits):
     keys = RSA.generate(bits=nBits)
     pk = keys.publickey()
     return (pk.n, pk.e)
 
-#Returns a tuple ((n, e), (n, d)) containing a public key tuple in the 1st position and a private key tuple in the 2nd position.
+# Returns a tuple ((n, e), (n, d, e, p, q, dP, dQ, qInv)) containing a public key tuple in the 1st position and a
+# private key tuple in the 2nd position. The private key keeps the CRT components, dP = d mod (p - 1),
+# dQ = d mod (q - 1) and qInv = q^-1 mod p, so that UAB_f_inv can work modulo p and q.
 def UAB_generate_RSA_key_pair(nBits):
     keys = RSA.generate(bits=nBits)
     pk = keys.publickey()
     pk_vars = (pk.n, pk.e)
-    sk_vars =  (keys.n, keys.d)
+    sk_vars = (keys.n, keys.d, keys.e, keys.p, keys.q, keys.d % (keys.p - 1), keys.d % (keys.q - 1),
+               int(inverse_mod(keys.q, keys.p)))
     return(pk_vars, sk_vars)
 
 
@@ -60,7 +74,10 @@ def UAB_f(PK, x):
     return converted.powermod(e, n)
 
 
+# Accepts a (n, d) private key or a (n, d, e, p, q, dP, dQ, qInv) one, which uses the CRT
 def UAB_f_inv(SK, y):
+    if len(SK) == RSA_CRT_PRIVATE_KEY_LENGTH:
+        return UAB_f_inv_crt(SK, y)
     if len(SK) != 2:
         return None
 
@@ -70,6 +87,60 @@ def UAB_f_inv(SK, y):
     return converted.powermod(d, n)
 
 
+# y^d mod n as two half-size exponentiations mod p and q, recombined with Garner's formula. The result is checked
+# against the public exponent before it is returned: a fault in one of the halves would otherwise leak a factor of n,
+# so on a mismatch the full-size exponentiation is used instead.
+def UAB_f_inv_crt(SK, y):
+    n, d, e, p, q, dP, dQ, qInv = [int(value) for value in SK]
+    y = int(y) % n
+
+    m1 = pow(y % p, dP, p)
+    m2 = pow(y % q, dQ, q)
+    x = m2 + q * (qInv * (m1 - m2) % p)
+
+    if pow(x, e, n) != y:
+        x = pow(y, d, n)
+    return Integer(x)
+
+
+# Number of bits b of the common domain [0, 2^b) of a ring: the largest modulus plus RING_DOMAIN_SLACK_BITS, so that
+# the extended trapdoor UAB_g is almost never the identity, rounded up to whole bytes
+def UAB_ring_domain_bits(public_keys):
+    b = max(int(pk[0]).bit_length() for pk in public_keys) + RING_DOMAIN_SLACK_BITS
+    return (b + 7) // 8 * 8
+
+
+# Uniform random value of the b-bit ring domain, for the glue value v and the xs of the non-signers
+def UAB_random_ring_value(b):
+    return Integer(randint(0, 2 ** b - 1))
+
+
+# Extension of f to the b-bit domain (Rivest, Shamir and Tauman): x = q * n + r maps to q * n + f(r) when the whole
+# block [q * n, (q + 1) * n) fits in the domain, and to itself otherwise. It is a permutation of [0, 2^b).
+def UAB_g(PK, x, b):
+    if len(PK) != 2:
+        return None
+
+    n = int(PK[0])
+    q, r = divmod(int(x), n)
+    if (q + 1) * n > 2 ** b:
+        return Integer(x)
+    return Integer(q * n + UAB_f(PK, r))
+
+
+# Inverse of UAB_g, with any private key accepted by UAB_f_inv
+def UAB_g_inv(SK, y, b):
+    n = int(SK[0])
+    q, r = divmod(int(y), n)
+    if (q + 1) * n > 2 ** b:
+        return Integer(y)
+
+    x = UAB_f_inv(SK, r)
+    if x is None:
+        return None
+    return Integer(q * n + x)
+
+
 def int_to_bytes(number: int):
     return number.to_bytes(length=(8 + (number + (number < 0)).bit_length()) // 8, byteorder='big', signed=True)
 
@@ -81,84 +152,161 @@ def int_from_bytes(binary_data: bytes):
 #Message to sign
 MESSAGE = "Uranium from conflict areas"
 NUMBER_OF_EMPLOYEES = 4
+employee_number = 3
 
-#Public key (pkSigner) and private key (skSigner) of the signer.
-signer_key_pair = UAB_generate_RSA_key_pair(1024)
-signer_private_key = signer_key_pair[1]
-signer_public_key = signer_key_pair[0]
+RSA_KEYRING_CACHE = "rsa_keyring.json"
+RING_KEY_BITS = 1024
+RING_FIXTURE_NAMES = ["signer_key_pair", "signer_private_key", "signer_public_key", "publicKeysGroup",
+                      "ring_domain_bits", "v", "xs", "ys"]
+RING_FIXTURES = {}
 
 
-publicKeysGroup = [None] * NUMBER_OF_EMPLOYEES
-employee_number = 3
-publicKeysGroup[employee_number] = signer_public_key
+# Check that a keyring slot holds a key pair with the CRT components
+def UAB_is_keyring_slot_valid(key_pair):
+    return key_pair is not None and len(key_pair) == 2 and len(key_pair[1]) == RSA_CRT_PRIVATE_KEY_LENGTH
+
+
+# Returns the key pair of a ring slot, with the format of UAB_generate_RSA_key_pair. The keys are generated on first
+# use and kept in the on-disk keyring, keyed by size and slot, so later runs reuse them. Slots without the CRT
+# components, written before they were kept, are replaced.
+def UAB_get_RSA_key_pair(nBits, slot):
+    name = "%d/%d" % (nBits, slot)
+    key_pair = UAB_load_json_cache(RSA_KEYRING_CACHE, {}).get(name)
+
+    if not UAB_is_keyring_slot_valid(key_pair):
+        new_key_pair = UAB_generate_RSA_key_pair(nBits)
+
+        # Re-read the keyring just before saving, in case another process filled the slot in the meantime
+        keyring = UAB_load_json_cache(RSA_KEYRING_CACHE, {})
+        key_pair = keyring.get(name)
+        if not UAB_is_keyring_slot_valid(key_pair):
+            key_pair = [list(new_key_pair[0]), list(new_key_pair[1])]
+            keyring[name] = key_pair
+            UAB_save_json_cache(RSA_KEYRING_CACHE, keyring)
 
-for i in range(NUMBER_OF_EMPLOYEES):
-    if employee_number != i:
-        public_key = UAB_generate_RSA_public_key(1024)
-        publicKeysGroup[i] = public_key
+    return (tuple(key_pair[0]), tuple(key_pair[1]))
 
-max_n_of_public_keys = 0
 
-for i in range(NUMBER_OF_EMPLOYEES):
-    if publicKeysGroup[i][0] > max_n_of_public_keys:
-        max_n_of_public_keys = publicKeysGroup[i][0]
+# Build the ring of the exercise the first time one of its module level names is used: the signer key pair
+# (pkSigner, skSigner), the public keys of the ring, and a glue value v with the xs and ys of the non-signers
+def UAB_get_ring_fixtures():
+    if len(RING_FIXTURES) == 0:
+        signer_key_pair = UAB_get_RSA_key_pair(RING_KEY_BITS, employee_number)
+        publicKeysGroup = [UAB_get_RSA_key_pair(RING_KEY_BITS, i)[0] for i in range(NUMBER_OF_EMPLOYEES)]
 
-v = Integer(2)
+        ring_domain_bits = UAB_ring_domain_bits(publicKeysGroup)
+        v = UAB_random_ring_value(ring_domain_bits)
 
-while v < max_n_of_public_keys:
-    bits = randint(1, 2048)
-    v = v ** bits
+        xs = [None] * NUMBER_OF_EMPLOYEES
+        ys = [None] * NUMBER_OF_EMPLOYEES
 
-xs = [None] * NUMBER_OF_EMPLOYEES
-ys = [None] * NUMBER_OF_EMPLOYEES
+        for i in range(NUMBER_OF_EMPLOYEES):
+            if employee_number != i:
+                xi = UAB_random_ring_value(ring_domain_bits)
+                xs[i] = xi
+                ys[i] = UAB_g(publicKeysGroup[i], xi, ring_domain_bits)
 
-for i in range(NUMBER_OF_EMPLOYEES):
-    if employee_number != i:
-        xi = randint(1024, 5000000)
-        xs[i] = xi
-        ys[i] = UAB_f(publicKeysGroup[i], xi)
+        RING_FIXTURES.update(signer_key_pair=signer_key_pair, signer_private_key=signer_key_pair[1],
+                             signer_public_key=signer_key_pair[0], publicKeysGroup=publicKeysGroup,
+                             ring_domain_bits=ring_domain_bits, v=v, xs=xs, ys=ys)
+    return RING_FIXTURES
+
+
+# The ring names are served lazily, so importing the module does not generate any key
+def __getattr__(name):
+    if name in RING_FIXTURE_NAMES:
+        return UAB_get_ring_fixtures()[name]
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 def UAB_solve_C(k, v, ys):
-    index_of_the_none_value = 0
+    index_of_the_none_value = ys.index(None)
+    ring_side_ys = itertools.chain(ys[:index_of_the_none_value], reversed(ys[index_of_the_none_value + 1:]))
+    return UAB_solve_C_stream(k, v, index_of_the_none_value, ring_side_ys)
+
+
+# UAB_solve_C over a stream of ys, in the order the two passes use them: the members before the signer from the first
+# one, then the members after the signer from the last one. Each y is used as soon as it arrives.
+def UAB_solve_C_stream(k, v, index_of_the_none_value, ring_side_ys):
+    ring_side_ys = iter(ring_side_ys)
     xor_value = v
     encrypted_ring_side_y = 0
 
-    while ys[index_of_the_none_value] is not None:
-        encrypted_ring_side_y = UAB_xor(xor_value, ys[index_of_the_none_value])
+    for i in range(index_of_the_none_value):
+        encrypted_ring_side_y = UAB_xor(xor_value, next(ring_side_ys))
         xor_value = UAB_E(k, encrypted_ring_side_y)
-        index_of_the_none_value += 1
 
     decrypted_ring_side_y = 0
     xor_value = v
-    for i in range(len(ys) - 1, index_of_the_none_value, -1):
+    for y in ring_side_ys:
         decrypted_ring_side_y = UAB_E(xor_value, k)
-        xor_value = UAB_xor(decrypted_ring_side_y, ys[i])
+        xor_value = UAB_xor(decrypted_ring_side_y, y)
 
-    if ys[0] is None:  # v must be operated twice.
+    if index_of_the_none_value == 0:  # v must be operated twice.
         decrypted_ring_side_y = UAB_E(xor_value, k)
         return UAB_xor(decrypted_ring_side_y, v)
 
     # This is using xor_value because at the last iteration it does not update the value.
     return UAB_xor(encrypted_ring_side_y, xor_value)
 
-def UAB_sign_ring_simple(m, v, xs, publicKeysGroup, skSigner):
+# With fixed_domain=True every value of the ring lives in the b-bit domain of UAB_ring_domain_bits and f is replaced by
+# its extension UAB_g, so v and the xs must be drawn from that domain (see UAB_random_ring_value)
+def UAB_sign_ring_simple(m, v, xs, publicKeysGroup, skSigner, fixed_domain=False):
     encrypted_ys = [None] * len(xs)
     signer_number = None
     hash_message = UAB_h(m)
+    b = UAB_ring_domain_bits(publicKeysGroup) if fixed_domain else None
 
     for i in range(len(xs)):
-        if xs[i] is not None:
-            encrypted_ys[i] = UAB_f(publicKeysGroup[i], xs[i])
-        else:
+        if xs[i] is None:
             signer_number = i
+        elif fixed_domain:
+            encrypted_ys[i] = UAB_g(publicKeysGroup[i], xs[i], b)
+        else:
+            encrypted_ys[i] = UAB_f(publicKeysGroup[i], xs[i])
 
     remaining_ys = UAB_solve_C(hash_message,v, encrypted_ys)
-    xs[signer_number] = UAB_f_inv(skSigner, remaining_ys)
+    if fixed_domain:
+        xs[signer_number] = UAB_g_inv(skSigner, remaining_ys, b)
+    else:
+        xs[signer_number] = UAB_f_inv(skSigner, remaining_ys)
 
     return (publicKeysGroup, v, xs)
 
-def UAB_verify_ring_signature_simple(m, sigma):
+RING_SIGNING_CHUNK_SIZE = 8
+
+
+# y of a ring member for a (PK, x, b) task, with UAB_g in the b-bit domain or with UAB_f if b is None
+def UAB_ring_member_y(task):
+    PK, x, b = task
+    if b is None:
+        return UAB_f(PK, x)
+    return UAB_g(PK, x, b)
+
+
+# UAB_sign_ring_simple with the trapdoor of every non-signer member evaluated on a pool of num_workers processes (one
+# per core by default), chunk_size members per task. The ys arrive in the order UAB_solve_C_stream uses them, so the
+# combining step runs while the pool is still working, and the result is the same sigma as the serial version.
+def UAB_sign_ring_parallel(m, v, xs, publicKeysGroup, skSigner, fixed_domain=False, num_workers=None,
+                           chunk_size=RING_SIGNING_CHUNK_SIZE):
+    signer_number = xs.index(None)
+    hash_message = UAB_h(m)
+    b = UAB_ring_domain_bits(publicKeysGroup) if fixed_domain else None
+
+    order = list(range(signer_number)) + list(range(len(xs) - 1, signer_number, -1))
+    tasks = ((publicKeysGroup[i], xs[i], b) for i in order)
+    with multiprocessing.Pool(num_workers) as pool:
+        remaining_ys = UAB_solve_C_stream(hash_message, v, signer_number,
+                                          pool.imap(UAB_ring_member_y, tasks, chunk_size))
+
+    if fixed_domain:
+        xs[signer_number] = UAB_g_inv(skSigner, remaining_ys, b)
+    else:
+        xs[signer_number] = UAB_f_inv(skSigner, remaining_ys)
+
+    return (publicKeysGroup, v, xs)
+
+def UAB_verify_ring_signature_simple(m, sigma, fixed_domain=False):
     if len(sigma) != 3:
         return None
 
@@ -168,8 +316,14 @@ def UAB_verify_ring_signature_simple(m, sigma):
     ys = []
     hash_message = UAB_h(m)
 
-    for i in range(len(xs)):
-        ys.append(UAB_f(public_keys[i], xs[i]))
+    if fixed_domain:
+        b = UAB_ring_domain_bits(public_keys)
+        if not all(0 <= value < 2 ** b for value in [v] + list(xs)):
+            return False
+        ys = [UAB_g(public_keys[i], xs[i], b) for i in range(len(xs))]
+    else:
+        for i in range(len(xs)):
+            ys.append(UAB_f(public_keys[i], xs[i]))
 
     for i in range(len(ys)):
         encrypted_ring_side_y = UAB_xor(v, ys[i])
@@ -178,6 +332,301 @@ def UAB_verify_ring_signature_simple(m, sigma):
     return v == sigma[1]
 
 
+# Ring signature with the keyed combining function E_k of utils.ring_core instead of the plain XOR of UAB_E, so the
+# ring equation depends on the message. It always works in the b-bit domain of UAB_ring_domain_bits, with the same
+# arguments and sigma as UAB_sign_ring_simple.
+def UAB_sign_ring_keyed(m, v, xs, publicKeysGroup, skSigner):
+    signer_number = xs.index(None)
+    b = UAB_ring_domain_bits(publicKeysGroup)
+    cipher = ring_cipher(UAB_h(m), b)
+
+    ys = [None if x is None else UAB_g(publicKeysGroup[i], x, b) for i, x in enumerate(xs)]
+    xs[signer_number] = UAB_g_inv(skSigner, UAB_ring_solve(cipher, v, ys, signer_number), b)
+
+    return (publicKeysGroup, v, xs)
+
+
+def UAB_verify_ring_signature_keyed(m, sigma):
+    if len(sigma) != 3:
+        return None
+
+    public_keys, v, xs = sigma
+    b = UAB_ring_domain_bits(public_keys)
+    if len(xs) != len(public_keys) or not all(0 <= value < 2 ** b for value in [v] + list(xs)):
+        return False
+
+    ys = [UAB_g(public_keys[i], xs[i], b) for i in range(len(xs))]
+    return UAB_ring_combine(ring_cipher(UAB_h(m), b), v, ys) == v
+
+
+RING_CONTEXT_CACHE_SIZE = 16
+RING_VERIFICATION_CHUNK_SIZE = 16
+RING_CONTEXTS = collections.OrderedDict()
+RING_VERIFICATION_POOL = None
+
+
+# Per-ring state of the verifiers: the public keys as (n, e) ints, the bits b of the ring domain, its bound 2^b and,
+# for each member, the largest multiple of n in the domain, below which UAB_g applies f. With them a member's y costs
+# one comparison and one exponentiation, with no big powers of two or divisions of the domain per signature.
+class ring_context_struct():
+    __slots__ = ("public_keys", "b", "bound", "limits")
+
+    # Initialize
+    def __init__(self, public_keys):
+        self.public_keys = tuple((int(pk[0]), int(pk[1])) for pk in public_keys)
+        self.b = UAB_ring_domain_bits(self.public_keys)
+        self.bound = 1 << self.b
+        self.limits = tuple(self.bound // n * n for n, e in self.public_keys)
+
+    # y of member i for x: UAB_g in the b-bit domain if fixed_domain, UAB_f otherwise
+    def member_y(self, i, x, fixed_domain):
+        n, e = self.public_keys[i]
+        x = int(x)
+        if not fixed_domain:
+            return pow(x, e, n)
+        if x >= self.limits[i]:
+            return x
+        r = x % n
+        return x - r + pow(r, e, n)
+
+
+# ring_context_struct of a ring, kept for the last RING_CONTEXT_CACHE_SIZE rings used. Every process keeps its own
+# cache, so the workers of UAB_verify_ring_signatures_batch build a context once per ring, not once per signature.
+def UAB_get_ring_context(public_keys):
+    ring = tuple((int(pk[0]), int(pk[1])) for pk in public_keys)
+    context = RING_CONTEXTS.get(ring)
+    if context is None:
+        context = ring_context_struct(ring)
+        RING_CONTEXTS[ring] = context
+        if len(RING_CONTEXTS) > RING_CONTEXT_CACHE_SIZE:
+            RING_CONTEXTS.popitem(last=False)
+    else:
+        RING_CONTEXTS.move_to_end(ring)
+    return context
+
+
+# Check the ring equation of a signature (v, xs) of a message with hash hash_message, for a ring_context_struct.
+# With fixed_domain=False the trapdoors are UAB_f, as in UAB_verify_ring_signature_simple.
+def UAB_ring_holds(hash_message, context, v, xs, fixed_domain=False):
+    if len(xs) != len(context.public_keys):
+        return False
+    if fixed_domain and not all(0 <= value < context.bound for value in [v] + list(xs)):
+        return False
+
+    value = v
+    for i in range(len(xs)):
+        value = UAB_E(hash_message, UAB_xor(value, context.member_y(i, xs[i], fixed_domain)))
+    return value == v
+
+
+# Verdicts of a (ring, signatures, fixed_domain) task of a batch verification worker, where signatures is a list of
+# (hash_message, v, xs) of that ring
+def UAB_verify_ring_task(task):
+    ring, signatures, fixed_domain = task
+    context = UAB_get_ring_context(ring)
+    return [UAB_ring_holds(hash_message, context, v, xs, fixed_domain) for hash_message, v, xs in signatures]
+
+
+# Pool of num_workers processes of UAB_verify_ring_signatures_batch. It is kept between calls, so a caller verifying
+# many batches pays for the processes once and the workers keep their ring contexts. It is only replaced when a
+# different number of workers is asked for.
+def UAB_get_ring_verification_pool(num_workers):
+    global RING_VERIFICATION_POOL
+    if RING_VERIFICATION_POOL is not None and RING_VERIFICATION_POOL[0] != num_workers:
+        RING_VERIFICATION_POOL[1].terminate()
+        RING_VERIFICATION_POOL = None
+    if RING_VERIFICATION_POOL is None:
+        pool = multiprocessing.Pool(num_workers)
+        atexit.register(pool.terminate)
+        RING_VERIFICATION_POOL = (num_workers, pool)
+    return RING_VERIFICATION_POOL[1]
+
+
+# Verify many (m, sigma) pairs and return one verdict per pair, in order: True, False, or None for a sigma that is not
+# a (public keys, v, xs) triple like UAB_verify_ring_signature_simple. Signatures are grouped by ring and sent to the
+# workers in chunks of chunk_size signatures of the same ring, so the public keys travel once per chunk, each message
+# is hashed once, and the signatures are checked on a pool of num_workers processes (one per core by default).
+def UAB_verify_ring_signatures_batch(pairs, fixed_domain=False, num_workers=None,
+                                     chunk_size=RING_VERIFICATION_CHUNK_SIZE):
+    if num_workers is None:
+        num_workers = os.cpu_count() or 1
+
+    verdicts = [None] * len(pairs)
+    rings = collections.OrderedDict()
+    hashes = {}
+
+    for i, (m, sigma) in enumerate(pairs):
+        if len(sigma) != 3:
+            continue
+
+        ring = tuple((int(pk[0]), int(pk[1])) for pk in sigma[0])
+        if m not in hashes:
+            hashes[m] = UAB_h(m)
+        rings.setdefault(ring, []).append((i, (hashes[m], sigma[1], sigma[2])))
+
+    indexes = []
+    tasks = []
+    for ring, signatures in rings.items():
+        for start in range(0, len(signatures), chunk_size):
+            chunk = signatures[start:start + chunk_size]
+            indexes.append([i for i, signature in chunk])
+            tasks.append((ring, [signature for i, signature in chunk], fixed_domain))
+
+    if num_workers == 1 or len(tasks) <= 1:
+        results = [UAB_verify_ring_task(task) for task in tasks]
+    else:
+        results = UAB_get_ring_verification_pool(num_workers).map(UAB_verify_ring_task, tasks, 1)
+
+    for chunk_indexes, chunk_results in zip(indexes, results):
+        for i, result in zip(chunk_indexes, chunk_results):
+            verdicts[i] = result
+    return verdicts
+
+
+RING_ID_SIZE = 32
+RING_LENGTH_FORMAT = struct.Struct(">I")
+RING_SIGNATURE_HEADER = struct.Struct(">32sHI")
+
+
+# Serialize the public keys of a ring: the number of members, then n and e of each member as length-prefixed big endian
+def UAB_encode_ring(public_keys):
+    data = bytearray(struct.pack(">H", len(public_keys)))
+    for pk in public_keys:
+        for value in (int(pk[0]), int(pk[1])):
+            encoded = value.to_bytes((value.bit_length() + 7) // 8, byteorder='big')
+            data += RING_LENGTH_FORMAT.pack(len(encoded)) + encoded
+    return bytes(data)
+
+
+def UAB_decode_ring(data):
+    data = memoryview(data)
+    num_members = struct.unpack_from(">H", data, 0)[0]
+    offset = 2
+    values = []
+    for i in range(2 * num_members):
+        length = RING_LENGTH_FORMAT.unpack_from(data, offset)[0]
+        offset += RING_LENGTH_FORMAT.size
+        values.append(int.from_bytes(data[offset:offset + length], byteorder='big'))
+        offset += length
+    return tuple(zip(values[0::2], values[1::2]))
+
+
+# Content-addressed ID of a ring: the SHA-256 of its encoding
+def UAB_ring_id(public_keys):
+    return hashlib.sha256(UAB_encode_ring(public_keys)).digest()
+
+
+# Rings known by ID, so signatures only carry the ID of their ring. With a path the registry is kept in that file as
+# length-prefixed ring encodings, appended as new rings are added.
+class ring_registry_struct():
+
+    def __init__(self, path=None):
+        self.rings = {}
+        self.file = None
+        if path is None:
+            return
+
+        self.file = open(path, "a+b")
+        self.file.seek(0)
+        data = self.file.read()
+        offset = 0
+        while offset + RING_LENGTH_FORMAT.size <= len(data):
+            length = RING_LENGTH_FORMAT.unpack_from(data, offset)[0]
+            if offset + RING_LENGTH_FORMAT.size + length > len(data):
+                break
+            encoded = data[offset + RING_LENGTH_FORMAT.size:offset + RING_LENGTH_FORMAT.size + length]
+            self.rings[hashlib.sha256(encoded).digest()] = UAB_decode_ring(encoded)
+            offset += RING_LENGTH_FORMAT.size + length
+
+        # Drop a ring left half written by an interrupted add_ring
+        self.file.truncate(offset)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.rings)
+
+    def __contains__(self, ring_id):
+        return ring_id in self.rings
+
+    # Register a ring and return its ID
+    def add_ring(self, public_keys):
+        encoded = UAB_encode_ring(public_keys)
+        ring_id = hashlib.sha256(encoded).digest()
+        if ring_id not in self.rings:
+            if self.file is not None:
+                self.file.write(RING_LENGTH_FORMAT.pack(len(encoded)) + encoded)
+                self.file.flush()
+            self.rings[ring_id] = UAB_decode_ring(encoded)
+        return ring_id
+
+    # Get the public keys of a ring ID, or None if it is not registered
+    def get_ring(self, ring_id):
+        return self.rings.get(bytes(ring_id))
+
+
+# Encode sigma = (public keys, v, xs) in the binary wire format, registering its ring: the ring ID, the number of xs
+# and the width in bytes of the fields, then v and every x as big endian fields of that width
+def UAB_encode_ring_signature(sigma, registry):
+    public_keys, v, xs = sigma
+    values = [int(v)] + [int(x) for x in xs]
+    width = max(1, max((value.bit_length() + 7) // 8 for value in values))
+
+    data = bytearray(RING_SIGNATURE_HEADER.pack(registry.add_ring(public_keys), len(xs), width))
+    for value in values:
+        data += value.to_bytes(width, byteorder='big')
+    return bytes(data)
+
+
+# Read the signatures of a binary file object in the wire format, yielding (ring ID, v, xs) for each of them without
+# looking the rings up. Stops at the end of the file, and raises ValueError on a truncated signature.
+def UAB_read_ring_signatures(f):
+    while True:
+        header = f.read(RING_SIGNATURE_HEADER.size)
+        if len(header) == 0:
+            return
+        if len(header) < RING_SIGNATURE_HEADER.size:
+            raise ValueError("truncated ring signature header")
+        ring_id, num_xs, width = RING_SIGNATURE_HEADER.unpack(header)
+        if width == 0:
+            raise ValueError("ring signature with fields of width 0")
+
+        fields = memoryview(f.read((num_xs + 1) * width))
+        if len(fields) < (num_xs + 1) * width:
+            raise ValueError("truncated ring signature")
+        values = [int.from_bytes(fields[i:i + width], byteorder='big') for i in range(0, len(fields), width)]
+        yield ring_id, values[0], values[1:]
+
+
+# Verify the signatures of a binary file object against the messages they sign, in the same order, yielding one
+# verdict per signature as it is read: None if its ring is not in the registry, True or False otherwise. The ring
+# contexts of UAB_get_ring_context are looked up once per ring ID. Raises ValueError if there are more messages than
+# signatures or the other way round.
+def UAB_verify_ring_signature_file(f, messages, registry, fixed_domain=False):
+    contexts = {}
+    missing = object()
+    for m, signature in itertools.zip_longest(messages, UAB_read_ring_signatures(f), fillvalue=missing):
+        if m is missing or signature is missing:
+            raise ValueError("the number of messages and of ring signatures in the file differ")
+        ring_id, v, xs = signature
+        if ring_id not in contexts:
+            public_keys = registry.get_ring(ring_id)
+            contexts[ring_id] = None if public_keys is None else UAB_get_ring_context(public_keys)
+
+        if contexts[ring_id] is None:
+            yield None
+        else:
+            yield UAB_ring_holds(UAB_h(m), contexts[ring_id], v, xs, fixed_domain)
+
+
 def test_case_1a_E(name, cases):
     res = True
     for case in cases:
@@ -272,40 +721,201 @@ def ejercicio_3b():
     MESSAGE = "Uranium from conflict areas"
     NUMBER_OF_EMPLOYEES = 4
 
-    # Public key (pkSigner) and private key (skSigner) of the signer.
-    signer_key_pair = UAB_generate_RSA_key_pair(1024)
-    signer_private_key = signer_key_pair[1]
-    signer_public_key = signer_key_pair[0]
-
-    publicKeysGroup = [None] * NUMBER_OF_EMPLOYEES
+    # Public key (pkSigner) and private key (skSigner) of the signer, from the keyring.
     employee_number = 3
-    publicKeysGroup[employee_number] = signer_public_key
-
-    for i in range(NUMBER_OF_EMPLOYEES):
-        if employee_number != i:
-            public_key = UAB_generate_RSA_public_key(1024)
-            publicKeysGroup[i] = public_key
-
-    max_n_of_public_keys = 0
-
-    for i in range(NUMBER_OF_EMPLOYEES):
-        if publicKeysGroup[i][0] > max_n_of_public_keys:
-            max_n_of_public_keys = publicKeysGroup[i][0]
+    signer_key_pair = UAB_get_RSA_key_pair(RING_KEY_BITS, employee_number)
+    signer_private_key = signer_key_pair[1]
 
-    v = Integer(2)
+    publicKeysGroup = [UAB_get_RSA_key_pair(RING_KEY_BITS, i)[0] for i in range(NUMBER_OF_EMPLOYEES)]
 
-    while v < max_n_of_public_keys:
-        bits = randint(1, 2048)
-        v = v ** bits
+    ring_domain_bits = UAB_ring_domain_bits(publicKeysGroup)
+    v = UAB_random_ring_value(ring_domain_bits)
 
     xs = [None] * NUMBER_OF_EMPLOYEES
     ys = [None] * NUMBER_OF_EMPLOYEES
 
     for i in range(NUMBER_OF_EMPLOYEES):
         if employee_number != i:
-            xi = randint(1024, 5000000)
+            xi = UAB_random_ring_value(ring_domain_bits)
             xs[i] = xi
-            ys[i] = UAB_f(publicKeysGroup[i], xi)
-    ring = UAB_sign_ring_simple(MESSAGE,v,xs, publicKeysGroup, signer_private_key)
-    is_valid = UAB_verify_ring_signature_simple(MESSAGE, ring)
+            ys[i] = UAB_g(publicKeysGroup[i], xi, ring_domain_bits)
+    ring = UAB_sign_ring_simple(MESSAGE,v,xs, publicKeysGroup, signer_private_key, fixed_domain=True)
+    is_valid = UAB_verify_ring_signature_simple(MESSAGE, ring, fixed_domain=True)
     print("Test 3b:", is_valid)
+
+def test_case_4a(name, cases):
+    messages = [case[0] for case in cases]
+    expected = [case[8] for case in cases]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rings.bin")
+        with ring_registry_struct(path) as registry:
+            f = io.BytesIO(b"".join(UAB_encode_ring_signature(case[7], registry) for case in cases))
+            num_rings = len(registry)
+            t1 = list(UAB_verify_ring_signature_file(f, messages, registry)) == expected
+
+        # The registry file gives back the same rings, and a registry without them gives no verdict
+        with ring_registry_struct(path) as registry:
+            t2 = len(registry) == num_rings and all(UAB_ring_id(case[7][0]) in registry for case in cases)
+        f.seek(0)
+        t3 = list(UAB_verify_ring_signature_file(f, messages, ring_registry_struct())) == [None] * len(cases)
+
+    # A signature with every value 0 still has fields one byte wide
+    sigma = (cases[0][7][0], 0, [0] * len(cases[0][7][2]))
+    data = UAB_encode_ring_signature(sigma, ring_registry_struct())
+    t4 = list(UAB_read_ring_signatures(io.BytesIO(data))) == [(UAB_ring_id(sigma[0]), 0, sigma[2])]
+
+    # Truncated files and a number of messages that does not match the signatures are errors
+    t5 = True
+    for data, num_messages in [(data[:-1], 1), (data[:RING_SIGNATURE_HEADER.size - 1], 1), (data, 2), (data, 0)]:
+        try:
+            list(UAB_verify_ring_signature_file(io.BytesIO(data), messages[:1] * num_messages, ring_registry_struct()))
+            t5 = False
+        except ValueError:
+            pass
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5)
+
+# (m, sigma) pairs signed in the fixed domain by the ring of the keyring, each followed by a copy with one x changed
+def UAB_fixed_domain_test_pairs(num_signatures):
+    public_keys = [UAB_get_RSA_key_pair(RING_KEY_BITS, i)[0] for i in range(NUMBER_OF_EMPLOYEES)]
+    signer_private_key = UAB_get_RSA_key_pair(RING_KEY_BITS, 0)[1]
+    b = UAB_ring_domain_bits(public_keys)
+
+    pairs = []
+    for m in range(num_signatures):
+        xs = [None] + [UAB_random_ring_value(b) for i in range(NUMBER_OF_EMPLOYEES - 1)]
+        sigma = UAB_sign_ring_simple(m, UAB_random_ring_value(b), xs, public_keys, signer_private_key, True)
+        forged_xs = list(sigma[2])
+        forged_xs[1] = (forged_xs[1] + 1) % 2 ** b
+        pairs += [(m, sigma), (m, (sigma[0], sigma[1], forged_xs))]
+    return pairs
+
+def test_case_4b(name, cases, num_workers):
+    pairs = [(case[0], case[7]) for case in cases] + [(cases[0][0], cases[0][7][:2])]
+    expected = [UAB_verify_ring_signature_simple(m, sigma) for m, sigma in pairs]
+    t1 = UAB_verify_ring_signatures_batch(pairs, False, num_workers, 2) == expected
+
+    fixed_pairs = UAB_fixed_domain_test_pairs(3)
+    expected = [UAB_verify_ring_signature_simple(m, sigma, True) for m, sigma in fixed_pairs]
+    t2 = UAB_verify_ring_signatures_batch(fixed_pairs, True, num_workers, 2) == expected
+    t3 = expected == [True, False] * 3
+
+    # The pool is kept for the next batch with the same number of workers
+    pool = RING_VERIFICATION_POOL
+    t4 = UAB_verify_ring_signatures_batch(fixed_pairs, True, num_workers, 2) == expected
+    t5 = num_workers == 1 or RING_VERIFICATION_POOL is pool
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5)
+
+def test_case_4c(name, numTries):
+    res = True
+    for i in range(numTries):
+        pk, sk = UAB_generate_RSA_key_pair(1024)
+        n, d, e, p, q, dP, dQ, qInv = sk
+        res = res & (len(sk) == RSA_CRT_PRIVATE_KEY_LENGTH) & (p * q == n) & (q * qInv % p == 1)
+
+        for y in [0, 1, n - 1, randint(0, n - 1), n + 5]:
+            x = UAB_f_inv(sk, y)
+            res = res & (x == UAB_f_inv((n, d), y)) & (UAB_f(pk, x) == y % n)
+
+        # A faulty half is caught by the check against e and the full-size exponentiation is used instead
+        faulty_sk = (n, d, e, p, q, dP + 1, dQ, qInv)
+        y = randint(2, n - 1)
+        res = res & (UAB_f_inv(faulty_sk, y) == UAB_f_inv((n, d), y))
+    print("Test", name + ":", res)
+
+def test_case_4d(name, pk, sk, b):
+    # UAB_g is a permutation of the b-bit domain, UAB_g_inv its inverse, and f is applied wherever a whole block fits
+    values = [UAB_g(pk, x, b) for x in range(2 ** b)]
+    t1 = sorted(values) == list(range(2 ** b))
+    t2 = all(UAB_g_inv(sk, y, b) == x for x, y in enumerate(values))
+    t3 = all(values[x] == x for x in range(2 ** b // pk[0] * pk[0], 2 ** b))
+
+    # Signing in the fixed domain of the keyring ring, and values outside the domain are rejected
+    fixtures = UAB_get_ring_fixtures()
+    b = fixtures["ring_domain_bits"]
+    sigma = UAB_sign_ring_simple(MESSAGE, fixtures["v"], list(fixtures["xs"]), fixtures["publicKeysGroup"],
+                                 fixtures["signer_private_key"], fixed_domain=True)
+    t4 = UAB_verify_ring_signature_simple(MESSAGE, sigma, fixed_domain=True)
+    t5 = all(0 <= x < 2 ** b for x in sigma[2]) and b % 8 == 0
+    t6 = not UAB_verify_ring_signature_simple(MESSAGE, (sigma[0], sigma[1] + 2 ** b, sigma[2]), fixed_domain=True)
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5 & t6)
+
+def test_case_4e(name):
+    cache_dir = os.environ.get("FTI_CACHE_DIR")
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["FTI_CACHE_DIR"] = tmp
+        try:
+            # A slot is generated once and then read back from the keyring
+            key_pair = UAB_get_RSA_key_pair(1024, 0)
+            t1 = UAB_get_RSA_key_pair(1024, 0) == key_pair and UAB_get_RSA_key_pair(1024, 1) != key_pair
+            t2 = UAB_load_json_cache(RSA_KEYRING_CACHE, {})["1024/0"] == [list(key_pair[0]), list(key_pair[1])]
+
+            # A slot from before the CRT components is replaced by a full key pair
+            UAB_save_json_cache(RSA_KEYRING_CACHE, {"1024/0": [list(key_pair[0]), list(key_pair[1][:2])]})
+            t3 = len(UAB_get_RSA_key_pair(1024, 0)[1]) == RSA_CRT_PRIVATE_KEY_LENGTH
+        finally:
+            if cache_dir is None:
+                del os.environ["FTI_CACHE_DIR"]
+            else:
+                os.environ["FTI_CACHE_DIR"] = cache_dir
+
+    # The module level ring names come from the keyring
+    module = __import__(__name__, fromlist=["publicKeysGroup"])
+    t4 = module.publicKeysGroup == [UAB_get_RSA_key_pair(RING_KEY_BITS, i)[0] for i in range(NUMBER_OF_EMPLOYEES)]
+    t5 = module.signer_key_pair == UAB_get_RSA_key_pair(RING_KEY_BITS, employee_number)
+    print("Test", name + ":", t1 & t2 & t3 & t4 & t5)
+
+def test_case_4f(name, cases, num_workers, chunk_size):
+    res = True
+    for case in cases:
+        m, v, pks, skSigner = case[0], case[1], case[4], case[5]
+        # The signer's x of case[3] may have been filled by an earlier test
+        xs = [None if pk[0] == skSigner[0] else x for pk, x in zip(pks, case[3])]
+        sigma = UAB_sign_ring_parallel(m, v, list(xs), pks, skSigner, False, num_workers, chunk_size)
+        res = res & (sigma == UAB_sign_ring_simple(m, v, list(xs), pks, skSigner)) & (sigma == case[7])
+
+    # Same sigma as the serial version in the fixed domain, wherever the signer is in the ring
+    fixtures = UAB_get_ring_fixtures()
+    publicKeysGroup, b = fixtures["publicKeysGroup"], fixtures["ring_domain_bits"]
+    for signer in range(NUMBER_OF_EMPLOYEES):
+        signer_private_key = UAB_get_RSA_key_pair(RING_KEY_BITS, signer)[1]
+        xs = [None if i == signer else UAB_random_ring_value(b) for i in range(NUMBER_OF_EMPLOYEES)]
+        sigma = UAB_sign_ring_parallel(MESSAGE, fixtures["v"], list(xs), publicKeysGroup, signer_private_key, True,
+                                       num_workers, chunk_size)
+        expected = UAB_sign_ring_simple(MESSAGE, fixtures["v"], list(xs), publicKeysGroup, signer_private_key, True)
+        res = res & (sigma == expected) & UAB_verify_ring_signature_simple(MESSAGE, sigma, fixed_domain=True)
+    print("Test", name + ":", res)
+
+def test_case_4g(name, b, numTries):
+    # E_k is a permutation with E_k^-1 as its inverse, and UAB_ring_solve closes the ring for any signer position
+    cipher = ring_cipher(UAB_h(MESSAGE), b)
+    res = b % 2 == 0
+    for i in range(numTries):
+        x = randint(0, 2 ** b - 1)
+        res = res & (cipher.decrypt(cipher.encrypt(x)) == x) & (0 <= cipher.encrypt(x) < 2 ** b)
+
+        ys = [randint(0, 2 ** b - 1) for j in range(5)]
+        signer = i % len(ys)
+        v = randint(0, 2 ** b - 1)
+        ys[signer] = UAB_ring_solve(cipher, v, ys, signer)
+        res = res & (UAB_ring_combine(cipher, v, ys) == v)
+
+    # Keyed signatures of the keyring ring only verify for the message they sign
+    fixtures = UAB_get_ring_fixtures()
+    sigma = UAB_sign_ring_keyed(MESSAGE, fixtures["v"], list(fixtures["xs"]), fixtures["publicKeysGroup"],
+                                fixtures["signer_private_key"])
+    res = res & UAB_verify_ring_signature_keyed(MESSAGE, sigma)
+    res = res & (not UAB_verify_ring_signature_keyed(MESSAGE + ".", sigma))
+    res = res & (not UAB_verify_ring_signature_keyed(MESSAGE, (sigma[0], sigma[1], sigma[2][:-1])))
+    print("Test", name + ":", res)
+
+def ejercicio_4():
+    test_case_4a("4a.1", TEST_CASES_GOOD_SIMPLE + TEST_CASES_BAD)
+    test_case_4b("4b.1", TEST_CASES_GOOD_SIMPLE + TEST_CASES_BAD, 1)
+    test_case_4b("4b.2", TEST_CASES_GOOD_SIMPLE + TEST_CASES_BAD, 2)
+    test_case_4c("4c.1", 3)
+    test_case_4d("4d.1", (39407, 26077), skSignerTest, 17)
+    test_case_4e("4e.1")
+    test_case_4f("4f.1", TEST_CASES_2 + TEST_CASES_GOOD_SIMPLE, 2, 1)
+    test_case_4g("4g.1", 64, 20)
+    test_case_4g("4g.2", 1184, 5)
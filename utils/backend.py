@@ -0,0 +1,346 @@
+import importlib
+import math
+import os
+import random
+
+# The few number theory functions the practicas need, built on Python ints so that importing a practica does not pay
+# for `from sage.all import *`. gmpy2 speeds up the modular arithmetic when it is installed. Any other Sage name is
+# looked up in sage.all the first time it is used, so Sage is only loaded by the callers that really need it.
+
+try:
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+# Only the names implemented here. The Sage-only names are reachable as attributes of the module through __getattr__,
+# but `from utils.backend import *` does not bring them in, as that would need Sage to list them.
+__all__ = ["GF", "Integer", "ZZ", "euler_phi", "factor", "inverse_mod", "next_prime", "power_mod", "primitive_root",
+           "randint", "random_prime", "set_random_seed"]
+
+SMALL_PRIMES = [p for p in range(2, 1000) if all(p % d != 0 for d in range(2, int(p ** 0.5) + 1))]
+# The first 13 primes as Miller-Rabin bases give a deterministic answer below this bound
+DETERMINISTIC_PRIMALITY_BOUND = 3317044064679887385961981
+PRIMALITY_ROUNDS = 32
+POLLARD_RHO_ITERATIONS = 1 << 20
+
+RANDOM_STATE = random.Random()
+SAGE = None
+
+
+# Import sage.all the first time it is needed. Returns None if Sage is not installed.
+def UAB_load_sage():
+    global SAGE
+    if SAGE is None:
+        try:
+            SAGE = importlib.import_module("sage.all")
+        except ImportError:
+            return None
+    return SAGE
+
+
+# Names not implemented here come from Sage
+def __getattr__(name):
+    sage = UAB_load_sage() if not name.startswith("__") else None
+    if sage is None or not hasattr(sage, name):
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    return getattr(sage, name)
+
+
+# Integer with the Sage methods used by the practicas. Arithmetic between Integers (or with ints) stays an Integer.
+class Integer(int):
+    def __new__(cls, value=0, base=10):
+        if isinstance(value, (str, bytes)):
+            return int.__new__(cls, value, base)
+        return int.__new__(cls, int(value))
+
+    def is_prime(self, proof=None):
+        return UAB_is_prime(int(self))
+
+    def is_pseudoprime(self):
+        return UAB_is_prime(int(self))
+
+    def next_prime(self, proof=None):
+        return next_prime(self)
+
+    def gcd(self, other):
+        return Integer(math.gcd(int(self), int(other)))
+
+    def mod(self, modulus):
+        return Integer(int(self) % int(modulus))
+
+    def powermod(self, exponent, modulus):
+        return power_mod(self, exponent, modulus)
+
+    def inverse_mod(self, modulus):
+        return inverse_mod(self, modulus)
+
+    def nbits(self):
+        return int(self).bit_length()
+
+    def factor(self):
+        return factor(self)
+
+
+# Wrap an int operator so that int results, alone or in a tuple like the ones of divmod, come back as Integers.
+# __truediv__ is left as it is: Sage gives an exact rational, which a float cannot stand in for, and the practicas only
+# divide Integers with //.
+def UAB_wrap_int_operator(name):
+    operator = getattr(int, name)
+
+    def wrapped(self, *args):
+        result = operator(self, *args)
+        if type(result) is tuple:
+            return tuple(Integer(value) if type(value) is int else value for value in result)
+        return Integer(result) if type(result) is int else result
+
+    wrapped.__name__ = name
+    return wrapped
+
+
+for name in ["__abs__", "__add__", "__and__", "__divmod__", "__floordiv__", "__lshift__", "__mod__", "__mul__",
+             "__neg__", "__or__", "__pos__", "__pow__", "__radd__", "__rand__", "__rdivmod__", "__rfloordiv__",
+             "__rlshift__", "__rmod__", "__rmul__", "__ror__", "__rpow__", "__rrshift__", "__rshift__", "__rsub__",
+             "__rxor__", "__sub__", "__xor__"]:
+    setattr(Integer, name, UAB_wrap_int_operator(name))
+
+
+# Miller-Rabin test of n to base a, where n - 1 = d * 2^s with d odd
+def UAB_miller_rabin(n, a, d, s):
+    x = pow(a, d, n)
+    if x == 1 or x == n - 1:
+        return True
+    for i in range(s - 1):
+        x = x * x % n
+        if x == n - 1:
+            return True
+    return False
+
+
+# Check if n is prime. Trial division by the small primes, then Miller-Rabin: deterministic below
+# DETERMINISTIC_PRIMALITY_BOUND and with PRIMALITY_ROUNDS random bases (error below 2^-64) above it.
+def UAB_is_prime(n):
+    if n < 2:
+        return False
+    for p in SMALL_PRIMES:
+        if n % p == 0:
+            return n == p
+    if n < SMALL_PRIMES[-1] ** 2:
+        return True
+    if gmpy2 is not None:
+        return bool(gmpy2.is_prime(n, PRIMALITY_ROUNDS))
+
+    d, s = n - 1, 0
+    while d % 2 == 0:
+        d, s = d // 2, s + 1
+
+    bases = SMALL_PRIMES[:13]
+    if n >= DETERMINISTIC_PRIMALITY_BOUND:
+        bases = bases + [RANDOM_STATE.randint(2, n - 2) for i in range(PRIMALITY_ROUNDS)]
+    return all(UAB_miller_rabin(n, a, d, s) for a in bases)
+
+
+# a^e mod n. A negative e uses the inverse of a.
+def power_mod(a, e, n):
+    a, e, n = int(a), int(e), int(n)
+    if gmpy2 is not None:
+        return Integer(gmpy2.powmod(a, e, n))
+    if e < 0:
+        a, e = inverse_mod(a, n), -e
+    return Integer(pow(a, e, n))
+
+
+# Inverse of a mod n. Raises ZeroDivisionError if gcd(a, n) != 1.
+def inverse_mod(a, n):
+    a, n = int(a), int(n)
+    if gmpy2 is not None:
+        try:
+            return Integer(gmpy2.invert(a, n))
+        except ZeroDivisionError:
+            raise ZeroDivisionError("inverse of %s mod %s does not exist" % (a, n))
+
+    # Extended Euclid, as pow(a, -1, n) needs Python 3.8
+    old_r, r = a % n, n
+    old_x, x = 1, 0
+    while r != 0:
+        q = old_r // r
+        old_r, r = r, old_r - q * r
+        old_x, x = x, old_x - q * x
+    if old_r != 1:
+        raise ZeroDivisionError("inverse of %s mod %s does not exist" % (a, n))
+    return Integer(old_x % n)
+
+
+# Random integer in [a, b], from the generator reseeded by set_random_seed
+def randint(a, b):
+    return RANDOM_STATE.randint(int(a), int(b))
+
+
+# Reseed the random generator of the backend, from the OS if seed is None
+def set_random_seed(seed=None):
+    if seed is None:
+        seed = int.from_bytes(os.urandom(32), byteorder='big')
+    RANDOM_STATE.seed(int(seed))
+
+
+# Smallest prime greater than n
+def next_prime(n, proof=None):
+    candidate = int(n) + 1
+    if candidate <= 2:
+        return Integer(2)
+    if candidate % 2 == 0:
+        candidate += 1
+    while not UAB_is_prime(candidate):
+        candidate += 2
+    return Integer(candidate)
+
+
+# Random prime in [lbound, n]. proof is accepted for compatibility with Sage, the primality test is always
+# UAB_is_prime.
+def random_prime(n, proof=None, lbound=2):
+    n, lbound = int(n), max(int(lbound), 2)
+    if n < lbound:
+        raise ValueError("n must be greater than or equal to lbound")
+
+    while True:
+        p = next_prime(randint(lbound, n) - 1)
+        if p <= n:
+            return p
+        if next_prime(lbound - 1) > n:
+            raise ValueError("there are no primes between %s and %s" % (lbound, n))
+
+
+# Find a non-trivial factor of the odd composite n with Brent's variant of Pollard's rho. Returns None if none is
+# found within max_iterations steps (no limit if max_iterations is None).
+def UAB_pollard_rho(n, max_iterations=None):
+    iterations = 0
+    while max_iterations is None or iterations < max_iterations:
+        y, c, m = RANDOM_STATE.randint(1, n - 1), RANDOM_STATE.randint(1, n - 1), 128
+        g, r, q = 1, 1, 1
+        while g == 1:
+            x = y
+            for i in range(r):
+                y = (y * y + c) % n
+            k = 0
+            while k < r and g == 1:
+                ys = y
+                for i in range(min(m, r - k)):
+                    y = (y * y + c) % n
+                    q = q * abs(x - y) % n
+                g = math.gcd(q, n)
+                k += m
+            iterations += r
+            r *= 2
+            if max_iterations is not None and iterations >= max_iterations and g == 1:
+                return None
+
+        # The batched gcd overshot, retry the last batch one step at a time
+        if g == n:
+            g = 1
+            while g == 1:
+                ys = (ys * ys + c) % n
+                g = math.gcd(abs(x - ys), n)
+        if g != n:
+            return g
+    return None
+
+
+# Factor n as a sorted list of (prime, exponent). Factors that Pollard's rho cannot split within
+# POLLARD_RHO_ITERATIONS steps are handed to Sage if it is installed, otherwise rho keeps going.
+def factor(n):
+    n = abs(int(n))
+    if n == 0:
+        raise ArithmeticError("factorization of 0 is not defined")
+
+    factors = {}
+    for p in SMALL_PRIMES:
+        while n % p == 0:
+            factors[p] = factors.get(p, 0) + 1
+            n //= p
+
+    pending = [n] if n > 1 else []
+    while len(pending) > 0:
+        m = pending.pop()
+        if UAB_is_prime(m):
+            factors[m] = factors.get(m, 0) + 1
+            continue
+
+        d = UAB_pollard_rho(m, POLLARD_RHO_ITERATIONS)
+        if d is None:
+            sage = UAB_load_sage()
+            if sage is not None:
+                for p, e in sage.factor(m):
+                    factors[int(p)] = factors.get(int(p), 0) + int(e)
+                continue
+            d = UAB_pollard_rho(m)
+        pending += [d, m // d]
+
+    return [(Integer(p), e) for p, e in sorted(factors.items())]
+
+
+# Number of integers in [1, n] coprime to n
+def euler_phi(n):
+    n = int(n)
+    if n <= 0:
+        return Integer(0)
+    phi = n
+    for p, e in factor(n):
+        phi = phi // p * (p - 1)
+    return Integer(phi)
+
+
+# Smallest primitive root mod n. Raises ValueError if Z_n^* is not cyclic.
+def primitive_root(n):
+    n = abs(int(n))
+    if n in (1, 2):
+        return Integer(n - 1)
+    if n == 4:
+        return Integer(3)
+
+    odd_factors = factor(n // 2 if n % 4 == 2 else n)
+    if len(odd_factors) != 1 or odd_factors[0][0] == 2:
+        raise ValueError("no primitive root mod %s" % n)
+
+    phi = euler_phi(n)
+    phi_primes = [p for p, e in factor(phi)]
+    for g in range(2, n):
+        if math.gcd(g, n) == 1 and all(pow(g, phi // q, n) != 1 for q in phi_primes):
+            return Integer(g)
+
+
+# Z/pZ for a prime p. Calling it reduces an integer mod p.
+class prime_field():
+    def __init__(self, order):
+        if not UAB_is_prime(int(order)):
+            raise ValueError("the order of a prime field must be prime")
+        self.p = Integer(order)
+
+    def __call__(self, x):
+        return Integer(int(x) % self.p)
+
+    def order(self):
+        return self.p
+
+
+def GF(order):
+    return prime_field(order)
+
+
+# The integers, for ZZ(x) and ZZ.random_element
+class integer_ring():
+    def __call__(self, x):
+        return Integer(x)
+
+    # Uniform in [x, y), or in [0, x) if only x is given. With no bounds small integers are the most likely, with the
+    # same distribution as Sage: trunc(4 / (5 R)) for R uniform in [-1, 1].
+    def random_element(self, x=None, y=None):
+        if x is None:
+            r = 0.0
+            while r == 0.0:
+                r = RANDOM_STATE.uniform(-1, 1)
+            return Integer(math.trunc(4 / (5 * r)))
+        if y is None:
+            x, y = 0, x
+        return Integer(RANDOM_STATE.randrange(int(x), int(y)))
+
+
+ZZ = integer_ring()
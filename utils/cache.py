@@ -0,0 +1,34 @@
+import json
+import os
+
+
+# Directory for the data kept between runs (FTI_CACHE_DIR overrides ~/.cache/fti)
+def UAB_cache_dir():
+    path = os.environ.get("FTI_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "fti"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Get the path of a file in the cache directory
+def UAB_cache_path(name):
+    return os.path.join(UAB_cache_dir(), name)
+
+
+# Load a JSON cache file, returning default if it does not exist or cannot be parsed
+def UAB_load_json_cache(name, default):
+    try:
+        with open(UAB_cache_path(name)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+# Save a JSON cache file readable only by its owner. The file is replaced atomically, so concurrent readers never
+# see it half written
+def UAB_save_json_cache(name, data):
+    path = UAB_cache_path(name)
+    tmp_path = "%s.%d.tmp" % (path, os.getpid())
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
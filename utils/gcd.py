@@ -1,4 +1,4 @@
-from sage.all import *
+from utils.backend import *
 
 def calculate_inverse(e,p,q):
     euler = euler_phi(p * q)
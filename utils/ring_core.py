@@ -0,0 +1,74 @@
+import hashlib
+
+# Ring signature primitives on plain ints of a fixed width of b bits: the XOR of two values and a keyed combining
+# function E_k, a permutation of [0, 2^b) built as a Feistel network whose round functions are SHAKE-256 keyed with a
+# key schedule derived from k once. The ring equation is E_k(y_r ^ E_k(... E_k(y_1 ^ v))) = v.
+
+RING_CORE_ROUNDS = 4
+
+
+def UAB_xor(a, b):
+    return int(a) ^ int(b)
+
+
+# Fixed-length big endian bytes of a value of the b-bit domain
+def UAB_int_to_fixed_bytes(x, b):
+    return int(x).to_bytes((b + 7) // 8, byteorder='big')
+
+
+def UAB_int_from_fixed_bytes(data):
+    return int.from_bytes(data, byteorder='big')
+
+
+# Keyed permutation E_k of [0, 2^b), for an even b. The round keys are hashed into a SHAKE-256 state per round when
+# the cipher is built, so each call only copies those states and absorbs half a block.
+class ring_cipher():
+    def __init__(self, k, b, rounds=RING_CORE_ROUNDS):
+        if b % 2 != 0:
+            raise ValueError("the ring domain must have an even number of bits")
+        self.b = b
+        self.half_bits = b // 2
+        self.half_bytes = (self.half_bits + 7) // 8
+        self.mask = (1 << self.half_bits) - 1
+
+        key = UAB_int_to_fixed_bytes(k, max(int(k).bit_length(), 1))
+        self.round_states = []
+        for i in range(rounds):
+            round_key = hashlib.sha256(b"ring round key" + bytes([i]) + key).digest()
+            self.round_states.append(hashlib.shake_256(round_key))
+
+    def round_function(self, i, half):
+        state = self.round_states[i].copy()
+        state.update(half.to_bytes(self.half_bytes, byteorder='big'))
+        return int.from_bytes(state.digest(self.half_bytes), byteorder='big') & self.mask
+
+    def encrypt(self, x):
+        left, right = int(x) >> self.half_bits, int(x) & self.mask
+        for i in range(len(self.round_states)):
+            left, right = right, left ^ self.round_function(i, right)
+        return (left << self.half_bits) | right
+
+    def decrypt(self, y):
+        left, right = int(y) >> self.half_bits, int(y) & self.mask
+        for i in reversed(range(len(self.round_states))):
+            left, right = right ^ self.round_function(i, left), left
+        return (left << self.half_bits) | right
+
+
+# Fold every y of the ring into v: z = E_k(z ^ y) starting from z = v. The ring equation holds if the result is v.
+def UAB_ring_combine(cipher, v, ys):
+    z = int(v)
+    for y in ys:
+        z = cipher.encrypt(z ^ int(y))
+    return z
+
+
+# The y of the member at signer_index (ys[signer_index] is ignored) that makes UAB_ring_combine(cipher, v, ys) = v:
+# the members before it are folded forward from v, the ones after it are unfolded backwards from v with E_k^-1.
+def UAB_ring_solve(cipher, v, ys, signer_index):
+    z = UAB_ring_combine(cipher, v, ys[:signer_index])
+
+    w = int(v)
+    for y in reversed(ys[signer_index + 1:]):
+        w = cipher.decrypt(w) ^ int(y)
+    return cipher.decrypt(w) ^ z